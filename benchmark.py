@@ -0,0 +1,236 @@
+import sys
+import time
+import json
+import math
+import random
+import argparse
+import platform
+
+from evolution import GeneticAlgorithm
+
+############################ About this script
+#
+# This script is a benchmark suite for the GeneticAlgorithm in evolution.py.
+# It runs the algorithm on standard test functions with several dimensions, settings, and fixed seeds.
+# For each run, it records the number of evaluations needed to reach a target error, the time (CPU time of
+# the process, the best of several repeats, since single timings are noisy), and the final error.
+# The results are stored in a JSON file that may serve as a baseline.
+# A second JSON file may then be compared to the baseline to catch regressions in speed or quality.
+#
+# Usage:
+#   python benchmark.py run baseline.json [--suite quick|full]
+#   python benchmark.py compare baseline.json new.json
+#
+# Test functions (all have their optimum of 0 at the point 'shift', which is not the center of the prior):
+# - sphere: Sum of squares. The easiest possible problem.
+# - ellipsoid: Rotated, badly scaled quadratic with strongly correlated parameters.
+# - rosenbrock: Narrow curved valley.
+# - rastrigin: Many regularly spaced local optima.
+# - ackley: Nearly flat outer region with a deep hole in the center.
+#
+# Like the function simulation() in evolution.py, each function returns the inverted value, because
+# the GeneticAlgorithm looks for the highest possible result.
+
+
+def sphere(shift,parlist):
+    return 0-sum([(x-s)**2 for x,s in zip(parlist,shift)])
+
+def ellipsoid(shift,parlist):
+    ## Pairs of parameters are rotated by 45 degrees and one direction is scaled by 100.
+    d = [x-s for x,s in zip(parlist,shift)]
+    result = 0.0
+    for i in range(0,len(d)-1,2):
+        result+=100*(d[i]+d[i+1])**2+(d[i]-d[i+1])**2
+    if len(d)%2==1:
+        result+=d[-1]**2
+    return 0-result
+
+def rosenbrock(shift,parlist):
+    d = [x-s+1 for x,s in zip(parlist,shift)] ## The optimum of the classic function is at (1,1,...)
+    result = 0.0
+    for i in range(len(d)-1):
+        result+=100*(d[i+1]-d[i]**2)**2+(1-d[i])**2
+    return 0-result
+
+def rastrigin(shift,parlist):
+    d = [x-s for x,s in zip(parlist,shift)]
+    return 0-(10*len(d)+sum([v**2-10*math.cos(2*math.pi*v) for v in d]))
+
+def ackley(shift,parlist):
+    d = [x-s for x,s in zip(parlist,shift)]
+    n = len(d)
+    a = -20*math.exp(-0.2*(sum([v**2 for v in d])/n)**.5)
+    b = -math.exp(sum([math.cos(2*math.pi*v) for v in d])/n)
+    return 0-(a+b+20+math.e)
+
+
+FUNCTIONS = {'sphere':sphere,'ellipsoid':ellipsoid,'rosenbrock':rosenbrock,'rastrigin':rastrigin,'ackley':ackley}
+
+## Settings of the GeneticAlgorithm. Each entry is passed to the constructor or set as attribute.
+SETTINGS = {'default':{},
+            'large':{'psize':100},
+            'strict':{'selection':0.8},
+            'wild':{'mutation':0.4},
+            'covariance':{'sampling':'covariance'}}
+
+SUITES = {'quick':{'dims':[3,10],'settings':['default','covariance'],'seeds':[0,1,2],'maxgen':100,'repeats':3},
+          'full':{'dims':[3,10,30,100],'settings':list(SETTINGS.keys()),'seeds':[0,1,2,3,4],'maxgen':200,
+                  'repeats':3}}
+
+
+def shift_for(dim):
+    ## The location of the optimum for a given dimension. Fixed, so all runs are comparable.
+    rng = random.Random(dim)
+    return [rng.uniform(-2,2) for i in range(dim)]
+
+def run_case(fname,dim,setting,seed,maxgen=100,target=0.01,repeats=1):
+    ## Run one evolution and return its record.
+    ## The target is the error (distance from the optimum value 0) that counts as solved.
+    ## The evolution is repeated (with the same seed, so with the same result) and the best time is kept.
+    funct = FUNCTIONS[fname]
+    shift = shift_for(dim)
+    options = dict(SETTINGS[setting])
+    kwargs = {}
+    for k in ['psize','mutation','selection']:
+        if k in options:
+            kwargs[k]=options.pop(k)
+
+    times = []
+    for i in range(repeats):
+        ga = GeneticAlgorithm(dim,seed=seed,**kwargs)
+        for k,v in options.items():
+            setattr(ga,k,v)
+        ga.maxgen = maxgen
+        ga.eta = 0.0 ## Do not stop on convergence, so all runs have the same budget.
+
+        reached = [None]
+        def watch(ga,metrics):
+            if reached[0]==None and 0-metrics['Best']<=target:
+                reached[0] = ga.evaluations
+        ga.callback = watch
+
+        t = time.process_time() ## CPU time: Other processes on the machine do not count
+        ga.evolve(funct,shift)
+        times.append(time.process_time()-t)
+    t = min(times)
+
+    return {'Function':fname,'Dim':dim,'Setting':setting,'Seed':seed,
+            'EvalsToTarget':reached[0],
+            'Evaluations':ga.evaluations,
+            'Time':t,
+            'Error':0-funct(shift,ga.bestguess())}
+
+def run_suite(suite='quick',target=0.01,repeats=None,verbose=True):
+    ## Run all cases of a suite and return the complete record as a dictionary.
+    ## repeats: Number of timings of each run (defaults to the setting of the suite).
+    spec = SUITES[suite]
+    if repeats==None:
+        repeats = spec['repeats']
+    runs = []
+    for fname in FUNCTIONS:
+        for dim in spec['dims']:
+            for setting in spec['settings']:
+                for seed in spec['seeds']:
+                    r = run_case(fname,dim,setting,seed,spec['maxgen'],target,repeats)
+                    runs.append(r)
+                    if verbose:
+                        print('{0:11} {1:4} {2:11} {3:2}  evals-to-target {4:>6}  time {5:7.3f}s  error {6:.4g}'.format(
+                            fname,dim,setting,seed,str(r['EvalsToTarget']),r['Time'],r['Error']))
+    return {'Meta':{'Suite':suite,'Target':target,'Repeats':repeats,'Python':platform.python_version(),
+                    'Machine':platform.machine(),'Date':time.strftime('%Y-%m-%d %H:%M:%S')},
+            'Runs':runs}
+
+def median(l):
+    l = sorted(l)
+    n = len(l)
+    if n==0:
+        return None
+    if n%2==1:
+        return l[n//2]
+    return (l[n//2-1]+l[n//2])/2.0
+
+def summarize(record):
+    ## Aggregate the runs of each case (function, dimension, setting) over the seeds.
+    cases = {}
+    for r in record['Runs']:
+        key = (r['Function'],r['Dim'],r['Setting'])
+        if not key in cases:
+            cases[key]=[]
+        cases[key].append(r)
+    summary = {}
+    for key,runs in cases.items():
+        hits = [r['EvalsToTarget'] for r in runs if r['EvalsToTarget']!=None]
+        summary[key] = {'Solved':float(len(hits))/len(runs),
+                        'EvalsToTarget':median(hits),
+                        'Time':sum([r['Time'] for r in runs]), ## Total of all seeds (less noisy)
+                        'Error':median([r['Error'] for r in runs])}
+    return summary
+
+def compare(base,new,time_tol=1.25,min_time=0.1,total_tol=1.2,evals_tol=1.2,error_tol=2.0):
+    ## Compare a new record to a baseline. Returns the report as a list of lines and the number of regressions.
+    ## A case regresses if its time (total of all seeds) grows by more than time_tol and by more than
+    ## min_time seconds, its median evaluations to the target grow by more than evals_tol, fewer seeds
+    ## reach the target, or its median error grows by more than error_tol (and is above the target).
+    ## Short cases are dominated by timer noise, so the time of the whole suite is also checked with total_tol.
+    target = base['Meta']['Target']
+    bs = summarize(base)
+    ns = summarize(new)
+    lines = ['{0:11} {1:>4} {2:11}  {3:>15}  {4:>19}  {5:>23}  {6}'.format(
+        'Function','Dim','Setting','Time','EvalsToTarget','Error','')]
+    nreg = 0
+    btotal = 0.0
+    ntotal = 0.0
+    for key in sorted(bs.keys()):
+        if not key in ns:
+            continue
+        b = bs[key]
+        n = ns[key]
+        btotal+=b['Time']
+        ntotal+=n['Time']
+        flags = []
+        if b['Time']>0 and n['Time']/b['Time']>time_tol and n['Time']-b['Time']>min_time:
+            flags.append('SLOWER')
+        if n['Solved']<b['Solved']:
+            flags.append('SOLVED LESS')
+        elif b['EvalsToTarget']!=None and n['EvalsToTarget']!=None and n['EvalsToTarget']>b['EvalsToTarget']*evals_tol:
+            flags.append('MORE EVALS')
+        if n['Error']>target and n['Error']>b['Error']*error_tol:
+            flags.append('WORSE')
+        nreg+=len(flags)>0
+        lines.append('{0:11} {1:4} {2:11}  {3:6.3f} > {4:6.3f}  {5:>8} > {6:>8}  {7:10.4g} > {8:10.4g}  {9}'.format(
+            key[0],key[1],key[2],b['Time'],n['Time'],
+            str(b['EvalsToTarget']),str(n['EvalsToTarget']),b['Error'],n['Error'],' '.join(flags)))
+    lines.append('{0} of {1} cases regressed.'.format(nreg,len(lines)-1))
+    if btotal>0 and ntotal/btotal>total_tol:
+        lines.append('The suite got slower: {0:.3f}s > {1:.3f}s.'.format(btotal,ntotal))
+        nreg+=1
+    else:
+        lines.append('Time of the suite: {0:.3f}s > {1:.3f}s.'.format(btotal,ntotal))
+    return lines,nreg
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark suite for the GeneticAlgorithm in evolution.py')
+    sub = parser.add_subparsers(dest='command',required=True)
+    p = sub.add_parser('run',help='Run a suite and store the results as JSON.')
+    p.add_argument('output')
+    p.add_argument('--suite',choices=list(SUITES.keys()),default='quick')
+    p.add_argument('--target',type=float,default=0.01)
+    p.add_argument('--repeats',type=int,default=None,help='Timings of each run (the best one is kept).')
+    p = sub.add_parser('compare',help='Compare a new result file to a baseline.')
+    p.add_argument('baseline')
+    p.add_argument('new')
+    args = parser.parse_args()
+
+    if args.command=='run':
+        record = run_suite(args.suite,args.target,args.repeats)
+        with open(args.output,'w') as outf:
+            json.dump(record,outf,indent=1)
+    else:
+        with open(args.baseline) as inf:
+            base = json.load(inf)
+        with open(args.new) as inf:
+            new = json.load(inf)
+        lines,nreg = compare(base,new)
+        print('\n'.join(lines))
+        sys.exit(1 if nreg>0 else 0)
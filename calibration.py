@@ -0,0 +1,168 @@
+import math
+import random
+import multiprocessing
+
+import easyabm
+from evolution import GeneticAlgorithm
+
+############################ About this script
+#
+# This script calibrates the parameters of an easyabm scenario with the GeneticAlgorithm of evolution.py.
+# A scenario (e.g. simulate_chase or simulate_boids) is run without display for each parameter set.
+# A summary statistic reduces the final agents to a number, and the algorithm searches for the parameters
+# that bring this statistic as close as possible to a target value.
+#
+# Each parameter set is simulated with the same random seeds (common random numbers). The differences between
+# two parameter sets are therefore not blurred by different luck in the simulations.
+# The simulations are run in parallel processes.
+#
+# Usage:
+#   result = calibrate('chase',{'zombies':(0.2,0.1,0,1)},survivors,5,
+#                      fixed={'hunter':2,'prey':10,'master':[300,300],'ticks':500},replicates=4)
+#   print(result['Params'])
+#
+# Classes:
+# - Objective: The fitness function that is passed to the GeneticAlgorithm.
+#
+# Functions:
+# - survivors, hunters, polarization: Examples of summary statistics.
+# - calibrate: Runs the complete calibration.
+
+
+SCENARIOS = {'chase':easyabm.simulate_chase,
+             'standoff':easyabm.simulate_standoff,
+             'boids':easyabm.simulate_boids,
+             'boids2':easyabm.simulate_boids2}
+
+
+def survivors(agents,atype='Prey'):
+    ## Number of agents of a given type at the end of a simulation.
+    return len([a for a in agents if a.type==atype])
+
+def hunters(agents):
+    ## Number of hunters at the end of a chase.
+    return survivors(agents,'Hunter')
+
+def polarization(agents):
+    ## Alignment of a flock: Length of the mean direction vector of all agents.
+    ## 1 means that all agents fly in the same direction, 0 means there is no common direction.
+    x = sum([math.cos(a.direction) for a in agents])
+    y = sum([math.sin(a.direction) for a in agents])
+    return (x**2+y**2)**.5/len(agents)
+
+
+class Objective():
+    ## Fitness function for the GeneticAlgorithm. It translates an individual to arguments of the scenario,
+    ## runs the scenario once per seed and compares the mean statistic to the target.
+    ## The result is the negative squared distance to the target (the GeneticAlgorithm looks for the highest result).
+    ## Objects of this class can be sent to other processes as long as the scenario and the statistic
+    ## are defined at the top level of a module.
+    def __init__(self,scenario,params,statistic,target,fixed=None,seeds=[1]):
+        ## scenario: Function that runs a simulation and returns the list of agents.
+        ## params: List of (name, low, high, type) for each parameter of the individuals.
+        ## statistic: Function that takes the list of agents and returns a number.
+        ## target: Value that the statistic should reach.
+        ## fixed: Dictionary with further arguments for the scenario that are not calibrated.
+        ## seeds: Random seeds. Each individual is simulated once with each seed.
+        self.scenario = scenario
+        self.params = params
+        self.statistic = statistic
+        self.target = target
+        self.fixed = fixed or {}
+        self.seeds = seeds
+
+    def arguments(self,ind):
+        ## Translate an individual to the arguments of the scenario. Values are cut to their limits
+        ## and rounded for integer parameters.
+        kwargs = dict(self.fixed)
+        for p,v in zip(self.params,ind):
+            name,low,high,ptype = p
+            if low!=None and v<low: v=low
+            if high!=None and v>high: v=high
+            if ptype==int:
+                v = int(round(v))
+            kwargs[name] = v
+        return kwargs
+
+    def __call__(self,ind):
+        kwargs = self.arguments(ind)
+        state = random.getstate()
+        values = []
+        for s in self.seeds:
+            random.seed(s) ## Common random numbers: Every individual is simulated with the same seeds.
+            values.append(self.statistic(self.scenario(**kwargs)))
+        random.setstate(state)
+        m = float(sum(values))/len(values)
+        return 0-(m-self.target)**2
+
+
+def calibrate(scenario,mapping,statistic,target,fixed=None,replicates=4,psize=30,maxgen=20,
+              processes=None,evaluator=None,seed=None):
+    ## Calibrate a scenario with a GeneticAlgorithm and return the result as a dictionary.
+    ## scenario: Name in SCENARIOS (e.g. 'chase') or a function that returns the final list of agents.
+    ## mapping: Dictionary {argument name: prior} for each argument of the scenario to be calibrated.
+    ##          A prior is (mean, sd) or (mean, sd, low, high) or (mean, sd, low, high, int).
+    ##          low and high are limits (None for no limit), int rounds the argument to integers.
+    ## statistic: Function that takes the final list of agents and returns a number (e.g. survivors).
+    ## target: Value that the statistic should reach.
+    ## fixed: Dictionary with further arguments for the scenario. master is always headless.
+    ## replicates: Number of simulations (with common random seeds) per individual.
+    ## psize, maxgen: Settings of the GeneticAlgorithm.
+    ## processes: Number of parallel processes. Defaults to the number of cores. 1 runs everything in this process.
+    ## evaluator: Optional map-like function to test the individuals instead (e.g. evalfarm.Coordinator.map).
+    ## seed: Optional seed for the GeneticAlgorithm and the simulation seeds.
+    ##
+    ## The result contains 'Params' (calibrated arguments), 'Distance' (distance to target of the best
+    ## parameter set), 'History' (see GeneticAlgorithm.write_history()) and the 'GA' object itself.
+    if not callable(scenario):
+        scenario = SCENARIOS[scenario]
+
+    params = []
+    priors = []
+    for name,prior in mapping.items():
+        prior = tuple(prior)+(None,None,None)[:max(0,5-len(prior))]
+        priors.append((prior[0],prior[1]))
+        params.append((name,prior[2],prior[3],prior[4]))
+
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(32) for i in range(replicates)]
+    fixed = dict(fixed or {})
+    if not 'master' in fixed or not type(fixed['master'])==list:
+        fixed['master'] = [1000,1000] ## Simulate without display
+    objective = Objective(scenario,params,statistic,target,fixed,seeds)
+
+    ga = GeneticAlgorithm(len(params),priors,psize,seed=rng.getrandbits(64))
+    ga.maxgen = maxgen
+    ga.cache = {} ## The objective is deterministic, thanks to the common random numbers.
+
+    pool = None
+    if evaluator!=None:
+        ga.evaluator = evaluator
+    elif processes==None or processes>1:
+        pool = multiprocessing.Pool(processes)
+        ga.evaluator = pool.map
+    try:
+        ga.evolve(objective)
+    finally:
+        if pool!=None:
+            pool.close()
+            pool.join()
+        ga.evaluator = None
+
+    best = ga.history['Result'][-1][0]
+    return {'Params':objective.arguments(best[1]),
+            'Distance':(0-best[0])**.5,
+            'History':ga.write_history(),
+            'GA':ga}
+
+
+if __name__ == "__main__":
+
+    ## Example: Which zombie probability leaves 5 hunters after 400 ticks of a chase
+    ## on a small field that starts with 2 hunters and 10 prey?
+    result = calibrate('chase',{'zombies':(0.5,0.3,0,1)},hunters,5,
+                       fixed={'hunter':2,'prey':10,'master':[300,300],'ticks':400},
+                       replicates=3,psize=12,maxgen=5,seed=1)
+    print(result['Params'])
+    print(result['Distance'])
+    print(result['History']['Result_M'])
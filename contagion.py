@@ -0,0 +1,203 @@
+import numpy as np
+
+############################ About this script
+#
+# This script simulates the contagion in a network of households, like Covid_Sim.R, but for much larger networks.
+# The network is stored as sparse matrix (compressed rows, CSR): For each node, only the list of its neighbors
+# and the weights of these connections are kept. The R script keeps the full matrix of houses x houses.
+# In each step (day), only the edges of the infectious nodes are visited, all at once with NumPy.
+# Many replicates (with different patients zero and luck, on the same network) are simulated together.
+#
+# The rules are the same as in Covid_Sim.R:
+# - Each node has a state (1 = sane, 2 = sick, 3 = recovered), a contraction date (CDate), and a contagiousness (Cont).
+# - A sick node is infectious between 2 and 7 days after its contraction date.
+# - The infection risk of a sane node is the sum of the weights of its connections to infectious nodes,
+#   multiplied by its Cont. If the risk is higher than its luck (uniform between 1 and 300), the node is infected.
+# - A sick node recovers 14 days after its contraction date.
+#
+# Usage:
+#   net = random_network(1000000,degree=12,seed=1)
+#   c = Contagion(net,replicates=20,seed=2)
+#   history = c.run(60)
+#   print(history['Spread'][-1])  ## Share of nodes that contracted the virus in each replicate
+#
+# Classes:
+# - Network: A weighted network in sparse form.
+# - Contagion: The state of all replicates and the simulation.
+#
+# Functions:
+# - random_network: A random network with a given mean degree.
+# - household_network: The dense network of Covid_Sim.R.
+
+
+class Network():
+    ## A weighted network in compressed sparse rows (CSR): The neighbors of node i are
+    ## indices[indptr[i]:indptr[i+1]] with the weights weights[indptr[i]:indptr[i+1]].
+    ## Edges go from the row to the neighbor, i.e. node i infects its neighbors.
+    def __init__(self,indptr,indices,weights):
+        self.indptr = np.asarray(indptr,dtype=np.int64)
+        self.indices = np.asarray(indices,dtype=np.int32)
+        self.weights = np.asarray(weights,dtype=np.float32)
+        self.n = len(self.indptr)-1
+
+    @classmethod
+    def from_edges(cls,n,src,dst,weights,symmetric=True):
+        ## Create a network with n nodes from a list of edges (arrays of sources, destinations, and weights).
+        ## With symmetric=True, each edge is also added in the other direction (undirected network).
+        src = np.asarray(src,dtype=np.int64)
+        dst = np.asarray(dst,dtype=np.int64)
+        weights = np.asarray(weights,dtype=np.float32)
+        if symmetric:
+            src,dst = np.concatenate([src,dst]),np.concatenate([dst,src])
+            weights = np.concatenate([weights,weights])
+        order = np.argsort(src,kind='stable')
+        indptr = np.zeros(n+1,dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(src,minlength=n))
+        return cls(indptr,dst[order],weights[order])
+
+    @classmethod
+    def from_dense(cls,adjmat):
+        ## Create a network from an adjacency matrix (like adjmat in Covid_Sim.R). Entries of 0 are no edges.
+        adjmat = np.asarray(adjmat)
+        src,dst = np.nonzero(adjmat)
+        return cls.from_edges(adjmat.shape[0],src,dst,adjmat[src,dst],symmetric=False)
+
+    def degree(self):
+        ## Number of neighbors of each node.
+        return np.diff(self.indptr)
+
+    def edges(self,nodes):
+        ## Returns the positions (in .indices and .weights) of all edges of the given nodes, and the number
+        ## of edges of each node. The edges of the first node come first, then those of the second node, etc.
+        start = self.indptr[nodes]
+        count = self.indptr[nodes+1]-start
+        total = int(count.sum())
+        first = np.cumsum(count)-count ## Position of the first edge of each node in the result
+        return np.repeat(start-first,count)+np.arange(total),count
+
+
+def random_network(n,degree=10,weights=(0,2),seed=None):
+    ## Random undirected network with n nodes and the given mean degree.
+    ## weights: Range of the uniform weights. In Covid_Sim.R, the weights of the existing edges are between 0 and 2.
+    rng = np.random.default_rng(seed)
+    m = int(n*degree/2)
+    src = rng.integers(0,n,m)
+    dst = rng.integers(0,n,m)
+    keep = src!=dst ## No loops
+    w = rng.uniform(weights[0],weights[1],m)
+    return Network.from_edges(n,src[keep],dst[keep],w[keep])
+
+def household_network(houses=100,distancing=1.0,washing=1.5,seed=None):
+    ## The dense community of Covid_Sim.R: Each pair of households has a contact of uniform(-1,4), which
+    ## is reduced by social distancing (subtracted) and washing hands (divided). Contacts below 0 are dropped.
+    rng = np.random.default_rng(seed)
+    adjmat = rng.uniform(-1,4,(houses,houses))
+    np.fill_diagonal(adjmat,0)
+    adjmat = np.triu(adjmat)+np.triu(adjmat,1).T ## Symmetric
+    adjmat = (adjmat-distancing)/washing
+    adjmat[adjmat<0] = 0
+    np.fill_diagonal(adjmat,0)
+    return Network.from_dense(adjmat)
+
+
+class Contagion():
+    ## The contagion in a network, simulated in several replicates at once.
+    ## The state of all replicates is kept in arrays of shape (replicates, nodes).
+    def __init__(self,network,cont=None,replicates=1,zero=None,latent=2,infectious=7,recovery=14,
+                 luck=(1,300),seed=None):
+        ## network: A Network.
+        ## cont: Contagiousness of each node. Defaults to normal(3,0.5) as in Covid_Sim.R.
+        ## replicates: Number of replicates. All replicates share the network and the contagiousness.
+        ## zero: Patient zero of each replicate (list of nodes). Defaults to a random node per replicate.
+        ## latent, infectious: A sick node is infectious from day CDate+latent+1 to CDate+infectious-1.
+        ## recovery: A sick node is recovered after day CDate+recovery.
+        ## luck: Range of the uniform luck of each node and day.
+        ## seed: Optional seed of the random numbers.
+        self.network = network
+        self.rng = np.random.default_rng(seed)
+        n = network.n
+        if cont is None: ## (An array cannot be compared to None with ==)
+            cont = self.rng.normal(3,.5,n)
+        self.cont = np.asarray(cont,dtype=float)
+        self.latent = latent
+        self.infectious = infectious
+        self.recovery = recovery
+        self.luck = luck
+        self.replicates = replicates
+        self.callback = None ## Optional function callback(contagion), called after each day
+
+        self.day = 0
+        self.state = np.ones((replicates,n),dtype=np.int8)
+        self.cdate = np.full((replicates,n),-1,dtype=np.int32) ## -1: Not contracted (NA in Covid_Sim.R)
+        if zero is None:
+            zero = self.rng.integers(0,n,replicates)
+        zero = np.asarray(zero)
+        self.state[np.arange(replicates),zero] = 2
+        self.cdate[np.arange(replicates),zero] = 0
+        self.history = {'Date':[],'Spread':[],'Infected':[],'Recovered':[]}
+        self.record()
+
+    def sick(self):
+        ## Returns the replicates and nodes of all infectious nodes.
+        s = (self.state==2)&(self.day>self.cdate+self.latent)&(self.day<self.cdate+self.infectious)
+        return np.nonzero(s)
+
+    def step(self):
+        ## Simulate one day in all replicates.
+        self.day+=1
+        n = self.network.n
+        rep,src = self.sick()
+        if len(src)>0:
+            ## Visit all edges of the infectious nodes and add up the weights for each (replicate, node).
+            e,count = self.network.edges(src)
+            keys = np.repeat(rep.astype(np.int64),count)*n+self.network.indices[e]
+            keys,inv = np.unique(keys,return_inverse=True)
+            risk = np.bincount(inv,weights=self.network.weights[e])
+            r = keys//n
+            j = keys%n
+            risk*=self.cont[j]
+            luck = self.rng.uniform(self.luck[0],self.luck[1],len(keys))
+            new = (risk>luck)&(self.state[r,j]==1)
+            self.state[r[new],j[new]] = 2
+            self.cdate[r[new],j[new]] = self.day
+
+        recovered = (self.state==2)&(self.day>self.cdate+self.recovery)
+        self.state[recovered] = 3
+        self.record()
+        if self.callback!=None:
+            self.callback(self)
+
+    def record(self):
+        ## Add the share of ever infected, currently infected and recovered nodes of each replicate to the history.
+        n = float(self.network.n)
+        infected = (self.state==2).sum(axis=1)/n
+        recovered = (self.state==3).sum(axis=1)/n
+        self.history['Date'].append(self.day)
+        self.history['Spread'].append(infected+recovered)
+        self.history['Infected'].append(infected)
+        self.history['Recovered'].append(recovered)
+
+    def run(self,days=60):
+        ## Simulate until the given day or until no one is sick anymore (in all replicates).
+        ## Returns the history as dictionary of arrays (days x replicates, except for 'Date').
+        while self.day<days and (self.state==2).any():
+            self.step()
+        return dict([(k,np.array(v)) for k,v in self.history.items()])
+
+
+if __name__ == "__main__":
+
+    import time
+
+    ## Example 1: The community of Covid_Sim.R, 100 replicates.
+    c = Contagion(household_network(100,seed=1),replicates=100,seed=2)
+    h = c.run(60)
+    print('Households: Mean share of infected households after',c.day,'days:',h['Spread'][-1].mean())
+
+    ## Example 2: A million nodes with 12 contacts each, 10 replicates. With so few contacts,
+    ## the virus has to be more contagious (lower luck) to spread.
+    t = time.time()
+    net = random_network(1000000,degree=12,seed=3)
+    c = Contagion(net,replicates=10,luck=(1,60),seed=4)
+    h = c.run(60)
+    print('Million nodes:',round(time.time()-t,1),'seconds, share of infected nodes:',h['Spread'][-1])
@@ -1,3 +1,5 @@
+import os
+import copy
 import time
 import math
 import random
@@ -20,6 +22,9 @@ random.seed()
 # - Critter: This class is also a child of Agent. It has some additional functions that allow the agents to decide on the next
 #          step or may be used to kill the Agent or get the bearings to other coordinates.
 # - Boid: This class is also a child of Agent. Boids can align their own movement to other Boids in the vicinity.
+# - AgentState: A read-only copy of the position, direction, and type of an Agent.
+# - Scheduler: This class activates the agents in each tick of a simulation. The agents may act one after another
+#              in a fixed or random order, or all at once (synchronously) based on the state of the previous tick.
 #
 # Functions:
 # - rainbow: A simple color generator.
@@ -32,6 +37,7 @@ random.seed()
 #                      and flees from the previous. Each agent has a suitor and a target and the simulation will either
 #                      end in an endless circle or in wild eddies.
 # - simulate_boids: An example simulation with Boids that arrange each other to fly in the same direction as their neighbors.
+# - chase_decision, standoff_decision, boid_decision: The decisions of one agent in one tick of these simulations.
 #
 
 
@@ -175,6 +181,8 @@ class Agent():
     def draw(self):
         ## Initial drawing of the agent. After the agent is drawn for the first
         ## time, don't use this method again. Use .shift() to move existing agents.
+        if not hasattr(self.master,'feld'):
+            return ## No active arena (e.g. master is None or a list). The agent is not displayed.
         p = self.position()
         self.id = self.master.feld.create_oval(p[0]-self.size,
                                                p[1]-self.size,
@@ -430,9 +438,12 @@ class Boid(Agent):
     ## Child of the class Agent that adds some methods.
 
     def scan(self,others,radius=50):
+        ## Only the distances are needed here. The angles are computed later by .align() for the neighbors.
         found = []
         for o in others:
-            d = self.relative(o)[2]#((o.xpos-self.xpos)**2+(o.ypos-self.ypos)**2)**.5
+            xd = o.xpos-self.xpos
+            yd = o.ypos-self.ypos
+            d = (xd**2+yd**2)**.5
             if d < radius and d > 1:
                 found.append(o)
         return found
@@ -514,6 +525,160 @@ class Boid(Agent):
             self.ypos=self.limit[1]
         self.shift()
         time.sleep(self.delay)
+
+
+class AgentState():
+    ## A read-only copy of the state of an Agent: Position, direction, speed, size, type, and color.
+    ## Objects of this class may be passed to the methods of agents instead of the agents themselves.
+    def __init__(self,agent=None):
+        if agent!=None:
+            self.load(agent)
+
+    def load(self,agent):
+        ## Copy the state of an agent into this object.
+        self.xpos = agent.xpos
+        self.ypos = agent.ypos
+        self.direction = agent.direction
+        self.speed = agent.speed
+        self.size = agent.size
+        self.type = agent.type
+        self.col = agent.col
+
+
+class Scheduler():
+    ## The scheduler activates all agents in each tick of a simulation. Each agent first decides (e.g. changes
+    ## its direction based on other agents) and then moves. There are three modes:
+    ## - 'sequential': The agents act one after another in the order of the list. Agent i+1 already sees the
+    ##                 new position of agent i. This is the classic behavior of all simulations.
+    ## - 'random': Like 'sequential', but the order is shuffled in each tick, so no agent has a fixed advantage.
+    ## - 'synchronous': All agents decide based on the state of the previous tick (double buffering). The state
+    ##                  of all agents is copied into a buffer, every agent reads from this buffer and writes only
+    ##                  to itself, and the buffers are swapped in the next tick. The result does not depend on the
+    ##                  order of the list and the decisions may be split into chunks for a pool of workers.
+    def __init__(self,mode='sequential',pool=None,chunks=None):
+        ## mode: 'sequential', 'random', or 'synchronous'.
+        ## pool: Optional pool of workers with a .map() method (e.g. concurrent.futures.ThreadPoolExecutor or
+        ##       multiprocessing.Pool) for the decisions in synchronous mode. The decision function has to be defined
+        ##       at the top level of a module for a pool of processes. Only the new directions are taken over
+        ##       from the workers. Entries to the history of the agents during decisions are lost.
+        ## chunks: Number of chunks the agents are split into for the pool (default: 4 per worker).
+        if not mode in ['sequential','random','synchronous']:
+            raise ValueError('Unknown mode: '+str(mode))
+        self.mode = mode
+        self.pool = pool
+        self.chunks = chunks
+        self.t = 0        ## Number of ticks so far
+        self.front = []   ## Buffer with the state of the previous tick (read by all agents)
+        self.back = []    ## Buffer that is filled with the current state and swapped to the front
+        self.callback = None ## Optional function callback(scheduler,agents), called after each tick (e.g. frames.Recorder)
+
+    def tick(self,agents,decide,move):
+        ## Activate all agents once.
+        ## decide(agent,i,view): Lets agent number i decide, based on the list 'view' of all agents (or their states).
+        ## move(agent): Moves the agent.
+        self.t+=1
+        if self.mode=='synchronous':
+            view = self.swap(agents)
+            if self.pool==None:
+                for i in range(len(agents)):
+                    decide(agents[i],i,view)
+            else:
+                self.decide_pooled(agents,decide,view)
+            for a in agents:
+                move(a)
+        else:
+            order = list(range(len(agents)))
+            if self.mode=='random':
+                random.shuffle(order)
+            for i in order:
+                decide(agents[i],i,agents)
+                move(agents[i])
+        if self.callback!=None:
+            self.callback(self,agents)
+
+    def swap(self,agents):
+        ## Fill the back buffer with the current state of all agents and swap it to the front.
+        ## The objects in the buffers are reused, so no new objects are created in each tick.
+        while len(self.back)<len(agents):
+            self.back.append(AgentState())
+        del self.back[len(agents):]
+        for s,a in zip(self.back,agents):
+            s.load(a)
+        self.front,self.back = self.back,self.front
+        return self.front
+
+    def decide_pooled(self,agents,decide,view):
+        ## Split the decisions into chunks and let the pool work on them.
+        ## The workers get light copies of the agents (without display and history).
+        n = self.chunks
+        if n==None:
+            ## Number of workers of a multiprocessing.Pool or a concurrent.futures executor
+            workers = getattr(self.pool,'_processes',None) or getattr(self.pool,'_max_workers',None)
+            n = 4*(workers or os.cpu_count() or 1)
+        size = max(1,-(-len(agents)//n))
+        jobs = []
+        for c in range(0,len(agents),size):
+            light = []
+            for a in agents[c:c+size]:
+                b = copy.copy(a)
+                b.master = None
+                b.history = []
+                light.append(b)
+            jobs.append((decide,light,list(range(c,c+len(light))),view,random.getrandbits(32),os.getpid()))
+        c = 0
+        for directions in self.pool.map(decide_chunk,jobs):
+            for d in directions:
+                agents[c].direction = d
+                c+=1
+
+
+def decide_chunk(job):
+    ## Worker function of Scheduler.decide_pooled(): Let a chunk of agents decide and return their new directions.
+    ## Workers in other processes get their own random seed, otherwise all of them would draw the same numbers.
+    decide,agents,indices,view,seed,pid = job
+    if not os.getpid()==pid:
+        random.seed(seed)
+    for a,i in zip(agents,indices):
+        decide(a,i,view)
+    return [a.direction for a in agents]
+
+
+def chase_decision(a,i,view):
+    ## Decision of one Critter in simulate_chase(): Hunters chase all prey, prey flees from all hunters.
+    seek = []
+    flee = []
+    if a.type == "Hunter":
+        for p in view:
+            if p.type=="Prey":
+                seek.append(p)
+    elif a.type == "Prey":
+        for p in view:
+            if p.type=="Hunter":
+                flee.append(p)
+    a.decide(flee,seek)  ## Decide the next step based on these two lists of agents.
+
+def standoff_decision(a,i,view):
+    ## Decision of one Critter in simulate_standoff(): Hunt the next agent in line, flee from the previous one.
+    hunt = i+1
+    flee = i-1
+    if hunt>len(view)-1:
+        hunt=0
+    if flee<0:
+        flee=-1
+    a.decide([view[flee]],[view[hunt]]) ## Decide based on the position of hunter and hunted
+
+def boid_decision(a,i,view):
+    ## Decision of one Boid in simulate_boids(): Align with the neighbors of the same color.
+    flock = [o for o in view if o.col==a.col]
+    neighbors = a.scan(flock,radius=90) ## Find other Boids in a given radius
+    a.align(neighbors,dist=30) ## Align own direction with these neighbors
+
+def move_critter(a):
+    a.move()
+
+def move_boid(a):
+    a.boidmove() ## Move the Boid (boidmove assumes an infinite arena)
+
         
 def rainbow(x):
     ## Color function that takes a float in the interval [0,1] and returns a color.
@@ -539,6 +704,15 @@ def rainbow(x):
     return outstr
 
 
+def scheduler(schedule=None):
+    ## Assisting function for the simulations: Returns a Scheduler for a Scheduler, a mode, or None (sequential).
+    if isinstance(schedule,Scheduler):
+        return schedule
+    elif schedule==None:
+        return Scheduler()
+    return Scheduler(schedule)
+
+
 def simulate_billiard(arena,n=10,size=10):
     ## Simple billiard simulation without any clash between balls.
     ## This simulation requires an arena (master) in which to play.
@@ -584,13 +758,15 @@ def simulate_billiard(arena,n=10,size=10):
 
 
 
-def simulate_chase(hunter=1,prey=1,bystander=0,size=10,zombies=0.0,master=None):
+def simulate_chase(hunter=1,prey=1,bystander=0,size=10,zombies=0.0,master=None,ticks=10000,schedule=None):
     ## In the chasing scenario, there are three possible types of Critters:
     ## -hunter: These agents hunt prey.
     ## -prey: These agents flee from hunters.
     ## -bystander: These agents don't interact with anyone and just mill around.
     ## The parameter 'zombies' determines the probability with which a prey that
     ## is killed by a hunter turns into a hunter itself.
+    ## The simulation ends when there is no prey left or after the given number of ticks.
+    ## schedule: Optional Scheduler or mode of a Scheduler ('sequential', 'random', 'synchronous').
 
 
     ## Determine the size of the playing field
@@ -631,26 +807,17 @@ def simulate_chase(hunter=1,prey=1,bystander=0,size=10,zombies=0.0,master=None):
         agents.append(a)
 
 
+    schedule = scheduler(schedule)
+
     ## Count the number of prey
     nprey = 0
     for a in agents:
         if a.type=="Prey":nprey+=1
     t=0
-    while t < 10000 and nprey>0: ## Run 10000 steps or until there is no prey anymore.
+    while t < ticks and nprey>0: ## Run 10000 steps (or the given number of ticks) or until there is no prey anymore.
         t+=1
-        for a in agents: ## For each agent, find out who they flee from and who they chase.
-            seek = []
-            flee = []
-            if a.type == "Hunter":
-                for p in agents:
-                    if p.type=="Prey":
-                        seek.append(p)
-            elif a.type == "Prey":
-                for p in agents:
-                    if p.type=="Hunter":
-                        flee.append(p)
-            a.decide(flee,seek)  ## Decide the next step based on these two lists of agents.
-            a.move() ## Move the agent in the given direction.
+        ## For each agent, find out who they flee from and who they chase and move the agent in the given direction.
+        schedule.tick(agents,chase_decision,move_critter)
 
 
         ## Count the casualties
@@ -673,8 +840,9 @@ def simulate_chase(hunter=1,prey=1,bystander=0,size=10,zombies=0.0,master=None):
     return agents  ## The final list of all active (not dead) agents is returned and may be evaluated.
 
 
-def simulate_standoff(n=3,master=None):
+def simulate_standoff(n=3,master=None,schedule=None):
     ## Make agents hunting each other. Each agent hunts the one next in line and is hunted by its predecessor.
+    ## schedule: Optional Scheduler or mode of a Scheduler ('sequential', 'random', 'synchronous').
 
     ## First create the agents
     agents = []
@@ -682,21 +850,15 @@ def simulate_standoff(n=3,master=None):
         a = Critter(master,size=10)
         a.col="#8080ff"
         agents.append(a)
+    schedule = scheduler(schedule)
 
     for t in range(10000): ## Run for 10000 ticks
-        for i in range(len(agents)): ## For each agent, define the hunter and hunted
-            hunt = i+1
-            flee = i-1
-            if hunt>len(agents)-1:
-                hunt=0
-            if flee<0:
-                flee=-1
-            agents[i].decide([agents[flee]],[agents[hunt]]) ## Decide based on the position of hunter and hunted
-            agents[i].move()
+        schedule.tick(agents,standoff_decision,move_critter) ## For each agent, define the hunter and hunted
     return agents
 
-def simulate_boids(n=10,master=None):
+def simulate_boids(n=10,master=None,ticks=1000,schedule=None):
     ## Simulation of a flock of boids
+    ## schedule: Optional Scheduler or mode of a Scheduler ('sequential', 'random', 'synchronous').
 
     ## First create the agents
     agents = []
@@ -704,18 +866,17 @@ def simulate_boids(n=10,master=None):
         a = Boid(master, size=4)
         a.col="#80ffaa"
         agents.append(a)
+    schedule = scheduler(schedule)
     t=0
-    while t < 1000:
+    while t < ticks:
         t+=1
-        for a in agents:
-            neighbors = a.scan(agents,radius=90) ## Find other Boids in a given radius
-            a.align(neighbors,dist=30) ## Align own direction with these neighbors
-            a.boidmove() ## Move the Boid (boidmove assumes an infinite arena)
+        schedule.tick(agents,boid_decision,move_boid) ## Align with neighbors and move
 
     return agents
 
-def simulate_boids2(n=10,master=None):
+def simulate_boids2(n=10,master=None,schedule=None):
     ## Simulation of a flock of boids
+    ## schedule: Optional Scheduler or mode of a Scheduler ('sequential', 'random', 'synchronous').
 
     ## First create two groups of agents with different colors
     agents = []
@@ -729,18 +890,12 @@ def simulate_boids2(n=10,master=None):
         b.col="#ff80aa"
         bgents.append(b)
 
+    schedule = scheduler(schedule)
+
     t=0
     while t < 1000:
         t+=1
-        for a in agents:
-            neighbors = a.scan(agents,radius=90)
-            a.align(neighbors,dist=30)
-            a.boidmove()
-
-        for b in bgents:
-            neighbors = b.scan(bgents,radius=90)
-            b.align(neighbors,dist=30)
-            b.boidmove()
+        schedule.tick(agents+bgents,boid_decision,move_boid) ## Each Boid only aligns with its own color
 
     return agents
 
@@ -0,0 +1,211 @@
+import random
+import statistics
+import multiprocessing
+
+import easyabm
+from calibration import SCENARIOS
+
+############################ About this script
+#
+# This script answers questions like "What share of prey survives a chase with zombies=0.2?" with as few
+# simulations as possible. Instead of a fixed number of replicates, an ensemble of runs is simulated batch by
+# batch in parallel processes until the confidence intervals of the outcomes are narrow enough.
+#
+# The outcomes of each run (e.g. the number of agents of each type at the end and the ticks until the prey is
+# extinct) are not stored. Only their running mean and variance (Welford's method) and the frequency of each
+# value are kept, so the memory does not grow with the number of runs.
+#
+# Usage:
+#   result = ensemble('chase',{'hunter':2,'prey':10,'zombies':0.2,'master':[300,300],'ticks':400},
+#                     width={'Prey':1.0})
+#   print(result['Outcomes']['Prey']['Mean'],result['Runs'],result['Saved'])
+#
+# Classes:
+# - Outcome: Running statistics and distribution of one outcome.
+# - Replicate: One run of a scenario with a given seed. Sent to the worker processes.
+#
+# Functions:
+# - census: Example of a statistic: Survivors by type, ticks, and ticks to extinction.
+# - ensemble: Runs the ensemble until the requested precision is reached.
+
+
+def census(agents,schedule,atype='Prey'):
+    ## Outcomes of one run: The number of agents of each type at the end, the number of ticks,
+    ## and the ticks to extinction of atype (None if there are agents of atype left).
+    out = {'Ticks':schedule.t,atype:0}
+    for a in agents:
+        out[a.type] = out.get(a.type,0)+1
+    out['Extinction'] = None
+    if out[atype]==0:
+        out['Extinction'] = schedule.t
+    return out
+
+
+class Outcome():
+    ## Running statistics of one outcome over the runs of an ensemble.
+    def __init__(self,digits=2):
+        ## digits: Values are rounded to this number of digits for the distribution.
+        self.n = 0      ## Number of values
+        self.mean = 0.0
+        self.ss = 0.0   ## Sum of squared deviations from the mean
+        self.min = None
+        self.max = None
+        self.digits = digits
+        self.counts = {} ## Rounded value: Number of runs
+
+    def add(self,value,times=1):
+        ## Welford's update with a new value (added 'times' times).
+        for i in range(times):
+            self.n+=1
+            d = value-self.mean
+            self.mean+=d/self.n
+            self.ss+=d*(value-self.mean)
+        if self.min==None or value<self.min:
+            self.min = value
+        if self.max==None or value>self.max:
+            self.max = value
+        v = round(value,self.digits)
+        self.counts[v] = self.counts.get(v,0)+times
+
+    def sd(self):
+        if self.n<2:
+            return None
+        return (self.ss/(self.n-1))**.5
+
+    def halfwidth(self,confidence=0.95):
+        ## Half width of the confidence interval of the mean (None with fewer than two values).
+        if self.n<2:
+            return None
+        z = statistics.NormalDist().inv_cdf(0.5+confidence/2)
+        t = z+(z**3+z)/(4*(self.n-1)) ## Approximate t-value for n-1 degrees of freedom
+        return t*self.sd()/self.n**.5
+
+    def summary(self,confidence=0.95):
+        ## The statistics as dictionary. 'Distribution' is a list of (value, share of runs).
+        h = self.halfwidth(confidence)
+        mean = None
+        if self.n>0:
+            mean = self.mean
+        out = {'N':self.n,'Mean':mean,'SD':self.sd(),'Min':self.min,'Max':self.max,'Low':None,'High':None}
+        if h!=None:
+            out['Low'] = self.mean-h
+            out['High'] = self.mean+h
+        out['Distribution'] = [(v,float(c)/self.n) for v,c in sorted(self.counts.items())] ## (Empty if n is 0)
+        return out
+
+
+class Replicate():
+    ## One run of a scenario. Objects of this class can be sent to other processes as long as the scenario and
+    ## the statistic are defined at the top level of a module.
+    def __init__(self,scenario,kwargs,statistic=census):
+        ## scenario: Function that runs a simulation with an argument schedule and returns the list of agents.
+        ## kwargs: Arguments of the scenario.
+        ## statistic: Function statistic(agents,schedule) that returns a dictionary of outcomes.
+        self.scenario = scenario
+        self.kwargs = kwargs
+        self.statistic = statistic
+
+    def __call__(self,seed):
+        state = random.getstate()
+        random.seed(seed)
+        schedule = easyabm.Scheduler()
+        agents = self.scenario(schedule=schedule,**self.kwargs)
+        random.setstate(state)
+        return self.statistic(agents,schedule)
+
+
+def ensemble(scenario,kwargs=None,statistic=census,width=None,confidence=0.95,minruns=10,maxruns=1000,
+             processes=None,batch=None,evaluator=None,callback=None,seed=None):
+    ## Run replicates of a scenario until the confidence intervals of the outcomes are narrow enough.
+    ## scenario: Name in calibration.SCENARIOS (e.g. 'chase') or a function (see Replicate).
+    ## kwargs: Arguments of the scenario. master is always headless.
+    ## statistic: Function statistic(agents,schedule) that returns a dictionary of outcomes (see census).
+    ##            Outcomes that are missing in a run count as 0. Outcomes of None are not observed in that run.
+    ## width: Requested width of the confidence interval, either one number for all outcomes or a dictionary
+    ##        {outcome: width} for the outcomes to watch. None runs all maxruns.
+    ## confidence: Level of the confidence intervals.
+    ## minruns, maxruns: Smallest and largest number of runs.
+    ## processes: Number of parallel processes. Defaults to the number of cores. 1 runs everything in this process.
+    ## batch: Number of runs between two checks of the confidence intervals. Defaults to the number of processes.
+    ## evaluator: Optional map-like function to run the replicates instead (e.g. evalfarm.Coordinator.map).
+    ## callback: Optional function callback(runs,outcomes), called after each batch.
+    ## seed: Optional seed for the seeds of the runs.
+    ##
+    ## The result contains 'Runs', 'Saved' (maxruns minus runs), 'Converged' (True if the requested width was
+    ## reached), and 'Outcomes' (see Outcome.summary()).
+    if not callable(scenario):
+        scenario = SCENARIOS[scenario]
+    kwargs = dict(kwargs or {})
+    if not 'master' in kwargs or not type(kwargs['master'])==list:
+        kwargs['master'] = [1000,1000] ## Simulate without display
+    replicate = Replicate(scenario,kwargs,statistic)
+    rng = random.Random(seed)
+
+    if processes==None:
+        processes = multiprocessing.cpu_count()
+    if batch==None:
+        batch = processes
+    pool = None
+    run = evaluator
+    if evaluator==None:
+        if processes>1:
+            pool = multiprocessing.Pool(processes)
+            run = pool.map
+        else:
+            run = lambda f,l: [f(x) for x in l]
+
+    outcomes = {}
+    runs = 0
+    converged = False
+    try:
+        while runs<maxruns and not converged:
+            seeds = [rng.getrandbits(32) for i in range(min(batch,maxruns-runs))]
+            for result in run(replicate,seeds):
+                for k,v in result.items():
+                    if not k in outcomes:
+                        outcomes[k] = Outcome()
+                        if runs>0 and v!=None: ## Missing in all earlier runs
+                            outcomes[k].add(0,runs)
+                for k,o in outcomes.items():
+                    v = result.get(k,0)
+                    if v!=None:
+                        o.add(v)
+                runs+=1
+
+            if callback!=None:
+                callback(runs,outcomes)
+            if width!=None and runs>=minruns:
+                if type(width)==dict:
+                    watch = width
+                else:
+                    watch = dict([(k,width) for k in outcomes])
+                converged = True
+                for k,w in watch.items():
+                    h = None
+                    if k in outcomes:
+                        h = outcomes[k].halfwidth(confidence)
+                    if h==None or 2*h>w:
+                        converged = False
+    finally:
+        if pool!=None:
+            pool.close()
+            pool.join()
+
+    return {'Runs':runs,
+            'Saved':maxruns-runs,
+            'Converged':converged,
+            'Outcomes':dict([(k,o.summary(confidence)) for k,o in outcomes.items()])}
+
+
+if __name__ == "__main__":
+
+    ## Example: What share of the prey survives a chase with zombies=0.2, on a small field with 2 hunters and
+    ## 10 prey? Runs until the number of surviving prey is known within +-0.5.
+    result = ensemble('chase',{'hunter':2,'prey':10,'zombies':0.2,'master':[300,300],'ticks':400},
+                      width={'Prey':1.0},seed=1)
+    prey = result['Outcomes']['Prey']
+    print('Share of surviving prey:',prey['Mean']/10,'(',prey['Low']/10,'to',prey['High']/10,')')
+    print('Distribution of surviving prey:',prey['Distribution'])
+    print('Ticks to extinction:',result['Outcomes']['Extinction']['Mean'],
+          'in',result['Outcomes']['Extinction']['N'],'runs')
+    print(result['Runs'],'runs,',result['Saved'],'runs saved.')
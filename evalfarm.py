@@ -0,0 +1,324 @@
+import os
+import sys
+import time
+import pickle
+import socket
+import threading
+import collections
+import multiprocessing
+from multiprocessing.managers import BaseManager
+
+############################ About this script
+#
+# This script distributes the tests of a GeneticAlgorithm (evolution.py) to worker processes on several machines.
+# A Coordinator serves a work queue over TCP. Workers connect to it, pull batches of individuals, test them,
+# and send the results back. Each worker sends a heartbeat while it is connected. If the heartbeat of a worker
+# stops (crash, lost network), the batches it was working on are handed out again. A batch that is lost by
+# too many workers (e.g. because it crashes them) counts as failed, so the evolution stops with an error
+# instead of waiting forever. The same happens to all open batches if every worker that ever connected is lost.
+#
+# The jobs and results are pickled, so whoever knows the key of a Coordinator can run code on it and on its
+# workers. Without a key, the Coordinator makes up a random one (see .authkey).
+#
+# Usage on the machine running the evolution:
+#   farm = Coordinator(('0.0.0.0',50000),authkey=open('farm.key','rb').read().strip())
+#   ga.evaluator = farm.map
+#   ga.evolve(simulation,[1,2,3])
+#   farm.close()
+#
+# Usage on each worker machine (the function to be optimized must be importable there as well). The key is read
+# from a file or from the environment variable EVALFARM_KEY, so it does not show up in the list of processes:
+#   python evalfarm.py worker HOST 50000 farm.key
+#   EVALFARM_KEY=... python evalfarm.py worker HOST 50000
+#
+# For tests on a single machine, farm.start_workers(n) starts n local worker processes.
+#
+# Classes:
+# - JobQueue: The queue of batches with their leases, results and the heartbeats of the workers.
+# - Coordinator: Serves a JobQueue and offers a map-like method that may be used as evaluator of a GeneticAlgorithm.
+#
+# Functions:
+# - work: The loop of a worker process.
+# - crash: A test function that kills its worker (used by the check on localhost at the end of this script).
+
+
+class FarmClient(BaseManager):
+    ## Manager used by the workers to connect to a Coordinator.
+    pass
+
+FarmClient.register('queue')
+
+
+class JobQueue():
+    ## The work queue of a Coordinator. All methods may be called from several threads at once.
+    def __init__(self,timeout=10.0,retries=2):
+        ## timeout: Number of seconds without heartbeat after which a worker counts as lost.
+        ## retries: Number of times a lost batch is handed out again before it counts as failed.
+        self.timeout = timeout
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.done = threading.Condition(self.lock)
+        self.pending = collections.deque() ## Ids of the batches that wait for a worker
+        self.batches = {}  ## Id: (function, list of individuals), pickled
+        self.leases = {}   ## Id: worker that is testing the batch
+        self.results = {}  ## Id: (list of results, error message or None)
+        self.beats = {}    ## Worker: time of the last sign of life
+        self.dispatches = {} ## Id: number of times the batch was handed out
+        self.nextid = 0
+        self.redispatched = 0 ## Number of batches handed out again because their worker was lost.
+        self.closed = False
+
+    def submit(self,funct,inds,size=10):
+        ## Split a list of individuals into batches of the given size and queue them. Returns the ids of the batches.
+        ## The batches are pickled here, so the workers unpickle them where a failure can be reported (see work()).
+        ids = []
+        with self.lock:
+            for i in range(0,len(inds),size):
+                self.batches[self.nextid] = pickle.dumps((funct,inds[i:i+size]))
+                self.pending.append(self.nextid)
+                ids.append(self.nextid)
+                self.nextid+=1
+        return ids
+
+    def pull(self,worker):
+        ## Called by a worker to get the next batch as (id, pickled function and individuals).
+        ## Returns None if there is no work at the moment and 'stop' if the queue was closed.
+        with self.lock:
+            self.beats[worker] = time.time()
+            if self.closed:
+                return 'stop'
+            while len(self.pending)>0:
+                bid = self.pending.popleft()
+                if bid in self.batches and not bid in self.results:
+                    self.leases[bid] = worker
+                    self.dispatches[bid] = self.dispatches.get(bid,0)+1
+                    return (bid,self.batches[bid])
+            return None
+
+    def push(self,worker,bid,values,error=None):
+        ## Called by a worker to return the results of a batch. Results of batches that were already
+        ## returned by another worker (after a re-dispatch) are ignored.
+        with self.lock:
+            self.beats[worker] = time.time()
+            if bid in self.batches and not bid in self.results:
+                self.results[bid] = (values,error)
+                self.done.notify_all()
+            if self.leases.get(bid)==worker:
+                del self.leases[bid]
+
+    def heartbeat(self,worker):
+        ## Called regularly by each worker to show that it is still alive.
+        with self.lock:
+            self.beats[worker] = time.time()
+
+    def requeue(self):
+        ## Hand out the batches of lost workers again. Returns the number of re-dispatched batches.
+        ## A batch that was already handed out more than self.retries times fails instead.
+        ## Must be called with the lock held.
+        now = time.time()
+        lost = [bid for bid,w in self.leases.items() if now-self.beats.get(w,0)>self.timeout]
+        n = 0
+        for bid in lost:
+            del self.leases[bid]
+            if self.dispatches.get(bid,0)>self.retries:
+                self.results[bid] = (None,'The batch was lost by {0} workers.'.format(self.dispatches[bid]))
+            else:
+                self.pending.appendleft(bid)
+                n+=1
+        return n
+
+    def collect(self,ids):
+        ## Wait until all batches with the given ids are done and return their results in order.
+        ## Lost batches are re-dispatched while waiting. If workers were connected but none of them sent a
+        ## heartbeat within the timeout, nobody is left to test the open batches and they fail.
+        with self.lock:
+            while not all([bid in self.results for bid in ids]):
+                self.done.wait(min(1.0,self.timeout/2))
+                self.redispatched+=self.requeue()
+                now = time.time()
+                if len(self.beats)>0 and all([now-t>self.timeout for t in self.beats.values()]):
+                    for bid in ids:
+                        if not bid in self.results:
+                            self.results[bid] = (None,'All workers were lost.')
+            values = []
+            errors = []
+            for bid in ids:
+                v,error = self.results.pop(bid)
+                del self.batches[bid]
+                self.dispatches.pop(bid,None)
+                if error!=None:
+                    errors.append(error)
+                else:
+                    values+=v
+        if len(errors)>0:
+            raise RuntimeError('A worker failed to test a batch: '+errors[0])
+        return values
+
+    def workers(self):
+        ## Returns the names of all workers that showed a sign of life within the timeout.
+        with self.lock:
+            now = time.time()
+            return [w for w,t in self.beats.items() if now-t<=self.timeout]
+
+
+class Coordinator():
+    ## Serves a JobQueue on a TCP address and distributes the tests of individuals to the connected workers.
+    def __init__(self,address=('127.0.0.1',0),authkey=None,batch=10,timeout=10.0,retries=2):
+        ## address: (host, port) to listen on. Port 0 picks a free port (see .address).
+        ## authkey: Shared secret (bytes). Workers need the same key to connect. Without a key, a random key is
+        ##          made up (.authkey). It is printed if the Coordinator listens on other hosts than this one.
+        ## batch: Number of individuals in one batch.
+        ## timeout: Seconds without heartbeat after which the batches of a worker are handed out again.
+        ## retries: Number of times a lost batch is handed out again before map() fails.
+        self.queue = JobQueue(timeout,retries)
+        self.batch = batch
+        if authkey==None:
+            authkey = os.urandom(16).hex().encode()
+            if not address[0] in ['127.0.0.1','localhost']:
+                print('Key of the evaluation farm (for the workers):',authkey.decode())
+        self.authkey = authkey
+        self.procs = []
+
+        class Manager(BaseManager):
+            pass
+        Manager.register('queue',callable=lambda: self.queue)
+        self.server = Manager(address=address,authkey=authkey).get_server()
+        self.server.stop_event = threading.Event()
+        self.address = self.server.address
+        self.stopped = False
+        self.thread = threading.Thread(target=self.serve,daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        ## Accept connections until the Coordinator is closed. Each connection is served by its own thread.
+        ## (Like serve_forever() of the manager's server, which cannot be stopped from accepting.)
+        while not self.stopped:
+            try:
+                c = self.server.listener.accept()
+            except Exception: ## Failed authentication, or the wake-up call of .close()
+                continue
+            threading.Thread(target=self.server.handle_request,args=(c,),daemon=True).start()
+
+    def map(self,funct,inds):
+        ## Test each individual with funct(ind) on the workers and return the list of results.
+        ## This method may be used as evaluator of a GeneticAlgorithm: ga.evaluator = farm.map
+        inds = [list(ind) for ind in inds]
+        if len(inds)==0:
+            return []
+        ids = self.queue.submit(funct,inds,self.batch)
+        return self.queue.collect(ids)
+
+    def start_workers(self,n=2,beat=1.0):
+        ## Start n worker processes on this machine.
+        host = self.address[0]
+        if host in ['0.0.0.0','']:
+            host = '127.0.0.1'
+        for i in range(n):
+            p = multiprocessing.Process(target=work,args=((host,self.address[1]),self.authkey,None,beat))
+            p.daemon = True
+            p.start()
+            self.procs.append(p)
+        return self.procs[-n:]
+
+    def close(self,wait=5.0):
+        ## Tell all workers to stop and shut the server down.
+        with self.queue.lock:
+            self.queue.closed = True
+        t = time.time()+wait
+        for p in self.procs:
+            p.join(max(0.1,t-time.time()))
+            if p.is_alive():
+                p.terminate()
+        self.stopped = True
+        self.server.stop_event.set() ## Connections end after their current request
+        host = self.address[0]
+        if host in ['0.0.0.0','']:
+            host = '127.0.0.1'
+        try:
+            socket.create_connection((host,self.address[1]),timeout=1.0).close() ## Wake up .serve()
+        except OSError:
+            pass
+        self.thread.join(5.0)
+        self.server.listener.close() ## Release the port
+
+
+def work(address,authkey,name=None,beat=1.0,idle=0.05):
+    ## The loop of a worker: Connect to a Coordinator, pull batches, test them, and push the results back.
+    ## A separate thread sends a heartbeat every 'beat' seconds. The loop ends when the Coordinator is closed
+    ## or cannot be reached anymore.
+    if name==None:
+        name = '{0}-{1}'.format(socket.gethostname(),os.getpid())
+    client = FarmClient(address=tuple(address),authkey=authkey)
+    client.connect()
+    queue = client.queue()
+
+    stop = threading.Event()
+    def heartbeat():
+        while not stop.wait(beat):
+            try:
+                queue.heartbeat(name)
+            except Exception:
+                break
+    threading.Thread(target=heartbeat,daemon=True).start()
+
+    try:
+        while True:
+            job = queue.pull(name)
+            if job=='stop':
+                break
+            elif job==None:
+                time.sleep(idle)
+                continue
+            bid,data = job
+            try:
+                funct,inds = pickle.loads(data) ## Fails e.g. if the function cannot be imported here
+                values = [funct(ind) for ind in inds]
+                queue.push(name,bid,values)
+            except Exception as e:
+                queue.push(name,bid,None,repr(e))
+    except (EOFError,ConnectionError):
+        pass ## Coordinator is gone
+    stop.set()
+
+def crash(ind):
+    ## Kill the worker that tests this individual, like a simulation that takes down its process.
+    os._exit(1)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv)>=4 and sys.argv[1]=='worker':
+        ## python evalfarm.py worker HOST PORT [KEYFILE]
+        ## The key is read from KEYFILE or from the environment variable EVALFARM_KEY.
+        if len(sys.argv)>4:
+            with open(sys.argv[4],'rb') as inf:
+                key = inf.read().strip()
+        elif 'EVALFARM_KEY' in os.environ:
+            key = os.environ['EVALFARM_KEY'].encode()
+        else:
+            sys.exit('The key of the farm is missing: Pass a key file or set EVALFARM_KEY.')
+        work((sys.argv[2],int(sys.argv[3])),key)
+
+    else:
+        ## Example: Evolution with three local worker processes.
+        from evolution import GeneticAlgorithm, simulation
+
+        farm = Coordinator(batch=5)
+        farm.start_workers(3)
+
+        g = GeneticAlgorithm(3)
+        g.evaluator = farm.map
+        g.evolve(simulation,[1,2,3])
+        print(g.bestguess())
+        print(g.age())
+        print(farm.queue.workers())
+        farm.close()
+
+        ## Check: A job that kills every worker makes map() fail instead of waiting forever.
+        farm = Coordinator(timeout=2.0)
+        farm.start_workers(2)
+        try:
+            farm.map(crash,[[1.0],[0.0]])
+        except RuntimeError as e:
+            print(e)
+        farm.close()
@@ -1,13 +1,25 @@
+import os
+import json
+import math
+import time
 import random
+import functools
+import itertools
+import statistics
+import multiprocessing
 
 class GeneticAlgorithm:
     ## This class is a complete genetic algorithm to determine the optimal point of a parameter space.
-    def __init__(self, nparam=1, priors=None, psize=50, mutation=0.2, selection=0.6):
+    def __init__(self, nparam=1, priors=None, psize=50, mutation=0.2, selection=0.6, seed=None):
         ## nparam: Number of parameters used in the function
         ## priors: Optional priors for each parameter or all parameters. If no prior is used, the prior is N(0,1)
         ## psize: Size of one population of parameter sets.
         ## mutation: Mutation rate for this population (chance to get outlier values)
         ## selection: Selection rate for this population (share of individuals to be killed after each step)
+        ## seed: Optional seed for the random number generator of this population. Each population has
+        ##       its own generator, so several populations (e.g. in an IslandModel) draw independent streams.
+        ##       Without a seed, the generator is seeded from the random module, so random.seed() still
+        ##       makes the evolution reproducible.
         ##
         ## **NOTE: The higher the mutation and the lower the selection, the slower the
         ##         convergence and the lower the risk of homing in on local optima.
@@ -16,9 +28,35 @@ class GeneticAlgorithm:
         self.psize = psize
         self.mutation = mutation
         self.selection = selection
-        self.history = {'Param':[self.paramspace],'Result':[]}
+        if seed==None:
+            seed = random.getrandbits(64)
+        self.rng = random.Random(seed)
+        self.history = {'Param':[],'Result':[]}
         self.eta=0.0001 ## Convergence criterium. A normal evolution stops if all results lie within an interval of breadth eta.
         self.maxgen=50  ## Usual maximal number of generations.
+        self.generation=0 ## Generations passed in the current run of .evolve(). Reset to 0 when the evolution ends.
+        self.cache=None   ## Optional fitness cache. Set to {} to remember the result of each tested individual and
+                          ## avoid testing survivors again. Only useful for deterministic functions.
+        self.evaluations=0 ## Number of calls of the function to be optimized.
+        self.cachehits=0   ## Number of results taken from the fitness cache instead.
+        self.checkpoint=None    ## Optional filename. If set, .evolve() writes a checkpoint to this file (see .save()).
+        self.checkpoint_every=1 ## Number of generations between two checkpoints.
+        self.logged=None        ## What the checkpoint log (see .save()) already contains.
+        self.surrogate=None ## Optional pre-screening of offspring: 'quadratic' or 'rbf' (see .offspring()).
+        self.oversample=4   ## With a surrogate, this many candidates are created for each place in the population.
+        self.window=100     ## Number of most recently tested individuals used to fit the surrogate.
+        self.rejected=0     ## Number of candidates discarded by the surrogate without calling the function.
+        self.sampling='independent' ## 'independent' samples each parameter on its own. 'covariance' samples from
+                                    ## the full covariance of the survivors with an adaptive step size (see .update_covariance()).
+        self.cma=None       ## State of the covariance sampling: Mean, covariance, step size, evolution path, Cholesky factor.
+        self.racing=None    ## Optional noise-aware testing for stochastic functions: (minimum, maximum) number of
+                            ## replicates per individual (see .race()). The result of an individual is its mean.
+        self.confidence=0.95 ## Confidence level used by .race() to decide whether an individual needs more replicates.
+        self.replicas={}    ## Replicate statistics of the current population used by .race().
+        self.evaluator=None ## Optional map-like function used to test several individuals at once, e.g. the
+                            ## .map method of a multiprocessing.Pool or of an evalfarm.Coordinator.
+        self.callback=None  ## Optional function that is called after each generation as callback(ga,metrics).
+                            ## The metrics are a dictionary with timings and descriptives (see .optimize()).
 
         ## Set up an initial parameter space (priors for the distribution of each parameter)        
         if type(priors) == list:
@@ -34,6 +72,7 @@ class GeneticAlgorithm:
         else:
             for i in range(nparam):
                 self.paramspace.append((0,1))
+        self.history['Param'].append(list(self.paramspace))
 
         ## Generate an intial population of parameter sets.
         ## Each has random values for each parameter.
@@ -44,12 +83,25 @@ class GeneticAlgorithm:
     def create_individual(self):
         ## Generate one random parameter set in the confines of the parameter space
         ind = []
+        if self.sampling=='covariance' and self.cma!=None:
+            ## Draw standard normal values (doubled for mutations) and correlate them with the Cholesky factor.
+            z = []
+            for p in self.paramspace:
+                mut = self.rng.random()<self.mutation
+                if mut:
+                    z.append(self.rng.normalvariate(0,2))
+                else:
+                    z.append(self.rng.normalvariate(0,1))
+            L = self.cma['L']
+            for i in range(len(z)):
+                ind.append(self.cma['Mean'][i]+self.cma['Sigma']*sum([L[i][k]*z[k] for k in range(i+1)]))
+            return ind
         for p in self.paramspace:
-            mut = random.random()<self.mutation
+            mut = self.rng.random()<self.mutation
             if mut:
-                ind.append(random.normalvariate(p[0],p[1]*2))
+                ind.append(self.rng.normalvariate(p[0],p[1]*2))
             else:
-                ind.append(random.normalvariate(p[0],p[1]))
+                ind.append(self.rng.normalvariate(p[0],p[1]))
         return ind
 
     def m_sd(self,l):
@@ -72,9 +124,71 @@ class GeneticAlgorithm:
             for i in range(np):
                 table[i].append(ind[i])
 
+        if self.sampling=='covariance':
+            self.update_covariance(table)
+        else:
+            for i in range(np):
+                self.paramspace[i]=self.m_sd(table[i])
+        self.history['Param'].append(list(self.paramspace))
+
+    def update_covariance(self,table):
+        ## Update the sampling distribution in the manner of CMA-ES, based on the currently living individuals.
+        ## The mean moves to the mean of the survivors. The covariance matrix learns from the steps of the
+        ## survivors away from the old mean (rank-mu update). The overall step size grows if the mean keeps
+        ## moving in the same direction and shrinks if it jumps back and forth (cumulative step size adaptation).
+        ## The parameter space is updated as well, so the descriptives of each parameter remain available.
+        np = len(self.paramspace)
+        mu = len(self.population)
+        if self.cma==None: ## Start with the current parameter space.
+            self.cma = {'Mean':[p[0] for p in self.paramspace],
+                        'C':[[self.paramspace[i][1]**2 if i==j else 0.0 for j in range(np)] for i in range(np)],
+                        'Sigma':1.0,
+                        'Path':[0.0]*np}
+            self.cma['L'] = cholesky(self.cma['C'])
+        if mu<2:
+            return
+
+        ## Learning rates (defaults of CMA-ES for equally weighted survivors)
+        cs = (mu+2.0)/(np+mu+5.0)
+        ds = 1+2*max(0,((mu-1.0)/(np+1))**.5-1)+cs
+        cmu = min(1.0,2*(mu-2+1.0/mu)/((np+2)**2+mu))
+        chin = np**.5*(1-1.0/(4*np)+1.0/(21*np*np)) ## Expected length of a standard normal vector
+
+        old = self.cma['Mean']
+        sigma = self.cma['Sigma']
+        L = self.cma['L']
+        new = [float(sum(table[i]))/mu for i in range(np)]
+
+        ## Evolution path of the mean in whitened coordinates (solve L*w = step)
+        step = [(new[i]-old[i])/sigma for i in range(np)]
+        w = []
         for i in range(np):
-            self.paramspace[i]=self.m_sd(table[i])
-        self.history['Param'].append(self.paramspace)
+            w.append((step[i]-sum([L[i][k]*w[k] for k in range(i)]))/L[i][i])
+        f = (cs*(2-cs)*mu)**.5
+        self.cma['Path'] = [(1-cs)*self.cma['Path'][i]+f*w[i] for i in range(np)]
+
+        ## Rank-mu update of the covariance matrix
+        ys = [[(ind[i]-old[i])/sigma for i in range(np)] for ind in self.population]
+        C = self.cma['C']
+        for i in range(np):
+            for j in range(np):
+                C[i][j] = (1-cmu)*C[i][j]+cmu*sum([y[i]*y[j] for y in ys])/mu
+
+        ## Step size adaptation
+        plen = sum([p*p for p in self.cma['Path']])**.5
+        self.cma['Sigma'] = sigma*math.exp(min(1.0,cs/ds*(plen/chin-1)))
+        self.cma['Mean'] = new
+        L = cholesky(C)
+        if L==None: ## Numerically broken covariance: Fall back to its diagonal.
+            for i in range(np):
+                for j in range(np):
+                    if not i==j: C[i][j]=0.0
+                C[i][i] = max(C[i][i],1e-300)
+            L = cholesky(C)
+        self.cma['L'] = L
+
+        for i in range(np):
+            self.paramspace[i]=(new[i],self.cma['Sigma']*C[i][i]**.5)
 
     def optimize(self,funct,*args):
         ## Do one evolutionary step, consisting of testing each individual, killing a fixed
@@ -85,12 +199,23 @@ class GeneticAlgorithm:
         ## The method takes a function and a list of arguments that should be passed to this
         ## function before appending the parameters. The parameters are passed to the function
         ## in the form of a list.
+        ##
+        ## If self.callback is set, it is called at the end of the step with a dictionary of metrics:
+        ## Generation, Evaluations and CacheHits in this step, EvalTime, SelectTime, UpdateTime and BreedTime
+        ## in seconds, EvalsPerSec, Best and Mean result, Spread (SD of each parameter) and Rejected
+        ## (candidates discarded by the surrogate).
 
         ## Test each individual
+        t0 = time.perf_counter()
+        counts = (self.evaluations,self.cachehits,self.rejected)
         ranking = []
-        for ind in self.population:
-            result = funct(*args,ind)
-            ranking.append((result,ind))
+        if self.racing==None:
+            results = self.evaluate(funct,args,self.population)
+        else:
+            results = self.race(funct,args,self.population)
+        t1 = time.perf_counter()
+        for i in range(len(self.population)):
+            ranking.append((results[i],self.population[i]))
         ranking = sorted(ranking,reverse=True)
 
         self.history['Result'].append(ranking)
@@ -101,27 +226,354 @@ class GeneticAlgorithm:
         for r in ranking[:nretain]:
             newpop.append(r[1])
         self.population = newpop
+        t2 = time.perf_counter()
 
         ## Re-Assess the parameter space
         self.update_params()
+        t3 = time.perf_counter()
 
         ## Repopulate the population
-        for i in range(len(self.population),self.psize):
-            self.population.append(self.create_individual())
+        self.population+=self.offspring(self.psize-len(self.population))
+
+        if self.callback!=None:
+            t4 = time.perf_counter()
+            nevals = self.evaluations-counts[0]
+            metrics = {'Generation':self.age(),
+                       'Evaluations':nevals,
+                       'CacheHits':self.cachehits-counts[1],
+                       'EvalTime':t1-t0,
+                       'SelectTime':t2-t1,
+                       'UpdateTime':t3-t2,
+                       'BreedTime':t4-t3,
+                       'EvalsPerSec':nevals/(t1-t0) if t1>t0 else 0.0,
+                       'Best':ranking[0][0],
+                       'Mean':float(sum([r[0] for r in ranking]))/len(ranking),
+                       'Spread':[p[1] for p in self.paramspace],
+                       'Rejected':self.rejected-counts[2]}
+            self.callback(self,metrics)
         return ranking
 
+    def offspring(self,n):
+        ## Generate n new individuals for the population.
+        ## If a surrogate is used, the method creates n*self.oversample candidates and only keeps the n
+        ## candidates that a cheap regression model of the tested individuals deems most promising.
+        ## The rejected candidates are never passed to the expensive function (counted in self.rejected).
+        ## Note that this is not the number of evaluations saved: Without a surrogate, these candidates would not
+        ## have been created. The saving shows in fewer evaluations (self.evaluations) until convergence.
+        ## The surrogate is only used once enough individuals have been tested to fit it.
+        model = None
+        if self.surrogate!=None and n>0:
+            model = self.fit_surrogate()
+        if model==None:
+            return [self.create_individual() for i in range(n)]
+
+        candidates = [self.create_individual() for i in range(n*self.oversample)]
+        scores = []
+        for i in range(len(candidates)):
+            scores.append((model(candidates[i]),i))
+        scores = sorted(scores,reverse=True)
+        self.rejected+=len(candidates)-n
+        return [candidates[s[1]] for s in scores[:n]]
+
+    def fit_surrogate(self):
+        ## Fit the surrogate model to the most recently tested individuals.
+        ## Returns a function that predicts the result of an individual or None if there is not enough data.
+        ##
+        ## 'quadratic': Least squares regression with all linear, quadratic and interaction terms. If there are
+        ##              too few individuals for the interactions, only linear and quadratic terms are used.
+        ## 'rbf':       Interpolation with gaussian radial basis functions around each tested individual.
+
+        ## Collect the latest result of each tested individual, newest first.
+        seen = {}
+        for ranking in self.history['Result'][::-1]:
+            for r in ranking:
+                key = tuple(r[1])
+                if not key in seen and abs(r[0])<float('inf'):
+                    seen[key]=r[0]
+            if len(seen)>=self.window:
+                break
+        points = list(seen.items())[:self.window]
+
+        ## All parameters are standardized with the current parameter space.
+        scale = [(p[0],p[1] if p[1]>0 else 1.0) for p in self.paramspace]
+        def standard(ind):
+            return [(ind[i]-scale[i][0])/scale[i][1] for i in range(len(scale))]
+        xs = [standard(p[0]) for p in points]
+        ys = [p[1] for p in points]
+        np = len(scale)
+
+        if self.surrogate=='quadratic':
+            if len(xs)>=(np+1)*(np+2)/2*1.5:
+                def features(z):
+                    f = [1.0]+z
+                    for i in range(np):
+                        for j in range(i,np):
+                            f.append(z[i]*z[j])
+                    return f
+            elif len(xs)>=(2*np+1)*1.5:
+                def features(z):
+                    return [1.0]+z+[v*v for v in z]
+            else:
+                return None
+            fs = [features(z) for z in xs]
+            nf = len(fs[0])
+            A = [[0.0]*nf for i in range(nf)]
+            b = [0.0]*nf
+            for k in range(len(fs)):
+                f = fs[k]
+                for i in range(nf):
+                    b[i]+=f[i]*ys[k]
+                    for j in range(nf):
+                        A[i][j]+=f[i]*f[j]
+            for i in range(nf):
+                A[i][i]+=1e-8*(A[i][i]+1) ## A small ridge keeps the system solvable.
+            w = solve(A,b)
+            if w==None:
+                return None
+            return lambda ind: sum([a*c for a,c in zip(w,features(standard(ind)))])
+
+        elif self.surrogate=='rbf':
+            if len(xs)<np+2:
+                return None
+            dists = sorted([sum([(a-c)**2 for a,c in zip(xs[i],xs[j])])
+                            for i in range(len(xs)) for j in range(i+1,len(xs))])
+            h2 = 2*max(dists[len(dists)//2],1e-12) ## Width of the kernel: Median squared distance.
+            ym = sum(ys)/len(ys)
+            A = [[math.exp(-sum([(a-c)**2 for a,c in zip(xi,xj)])/h2) for xj in xs] for xi in xs]
+            for i in range(len(xs)):
+                A[i][i]+=1e-6
+            w = solve(A,[y-ym for y in ys])
+            if w==None:
+                return None
+            def predict(ind):
+                z = standard(ind)
+                return ym+sum([w[i]*math.exp(-sum([(a-c)**2 for a,c in zip(z,xs[i])])/h2) for i in range(len(xs))])
+            return predict
+        return None
+
+    def evaluate(self,funct,args,inds,cache=True):
+        ## Test a list of individuals and return the list of their results.
+        ## Results of individuals found in the fitness cache (if there is one) are not computed again.
+        ## With cache=False, every individual is tested, e.g. to draw replicates of a noisy function.
+        usecache = cache and self.cache!=None
+        results = [None]*len(inds)
+        todo = []
+        for i in range(len(inds)):
+            key = tuple(inds[i])
+            if usecache and key in self.cache:
+                results[i] = self.cache[key]
+                self.cachehits+=1
+            else:
+                todo.append(i)
+
+        if self.evaluator==None:
+            values = [funct(*args,inds[i]) for i in todo]
+        else:
+            values = list(self.evaluator(functools.partial(funct,*args),[inds[i] for i in todo]))
+        self.evaluations+=len(todo)
+        for i,v in zip(todo,values):
+            results[i] = v
+            if usecache:
+                self.cache[tuple(inds[i])]=v
+        return results
+
+    def race(self,funct,args,inds):
+        ## Noise-aware testing of a list of individuals. Returns the mean result of each individual.
+        ## Each individual is first tested self.racing[0] times. Then, the method races the contenders
+        ## in the manner of successive halving: An individual is a contender if its confidence interval
+        ## still contains a cutoff (the border between survivors and the killed share, or between the best
+        ## and the second best individual). In each round, only the more doubtful half of the contenders
+        ## is kept and each of them gets as many new replicates as it already has, up to self.racing[1].
+        ## Individuals that are clearly better or clearly dominated drop out early.
+        ## Survivors keep their replicates from earlier generations.
+        rmin,rmax = max(2,self.racing[0]),self.racing[1]
+        z = statistics.NormalDist().inv_cdf(0.5+self.confidence/2)
+
+        ## Running statistics of each individual: [Number of replicates, Mean, Sum of squared deviations]
+        stats = []
+        for ind in inds:
+            stats.append(list(self.replicas.get(tuple(ind),[0,0.0,0.0])))
+
+        def add(i,value): ## Welford's update of the running statistics
+            s = stats[i]
+            s[0]+=1
+            d = value-s[1]
+            s[1]+=d/s[0]
+            s[2]+=d*(value-s[1])
+
+        todo = []
+        for i in range(len(inds)):
+            todo+=[i]*max(0,rmin-stats[i][0])
+        nretain = int(len(inds)*(1-self.selection))
+        ncontend = len(inds)
+        while len(todo)>0:
+            values = self.evaluate(funct,args,[inds[i] for i in todo],cache=False)
+            for i,v in zip(todo,values):
+                add(i,v)
+
+            order = sorted(range(len(inds)),key=lambda i: stats[i][1],reverse=True)
+            cutoffs = []
+            for c in [1,nretain]:
+                if c>0 and c<len(inds):
+                    cutoffs.append((stats[order[c-1]][1]+stats[order[c]][1])/2)
+
+            ## Variance pooled over the population. An individual whose few replicates happen to be equal
+            ## (common with integer results) is not exactly known, so it gets the pooled variance instead.
+            df = sum([s[0]-1 for s in stats if s[0]>1])
+            pooled = 0.0
+            if df>0:
+                pooled = sum([s[2] for s in stats])/df
+
+            ## Doubt of each individual: Smallest distance to a cutoff in units of its confidence interval.
+            doubt = []
+            for i in range(len(inds)):
+                k,m,ss = stats[i]
+                var = 0.0
+                if k>1:
+                    var = ss/(k-1)
+                    if ss==0:
+                        var = pooled
+                if k<rmax and var>0:
+                    t = z+(z**3+z)/(4*(k-1)) ## Approximate t-value for k-1 degrees of freedom
+                    se = (var/k)**.5
+                    d = min([abs(m-c) for c in cutoffs]+[float('inf')])/(t*se)
+                    if d<1:
+                        doubt.append((d,i))
+            ncontend = min(len(doubt),ncontend//2)
+            todo = []
+            for d,i in sorted(doubt)[:ncontend]:
+                todo+=[i]*min(stats[i][0],rmax-stats[i][0])
+
+        self.replicas = {}
+        for i in range(len(inds)):
+            self.replicas[tuple(inds[i])] = stats[i]
+        return [s[1] for s in stats]
+
     def evolve(self,funct,*args):
         ## Macro-Evolution using several steps to achieve an optimal solution.
         ## There are two abort conditions: The maximum number of generations (self.maxgen) is reached
         ## or the results vary by less than self.eta. In both cases, the evolution ends.
-        gen = 1
+        ## If self.checkpoint is set, the state is saved every self.checkpoint_every generations and at the end.
+        ## An evolution that was interrupted may then be continued with GeneticAlgorithm.resume().
         goal = False
         while not goal:
             r = sorted(self.optimize(funct,*args))
+            self.generation+=1
             eta = abs(r[0][0]-r[-1][0])
-            if gen>self.maxgen or eta<self.eta:
+            if self.generation>self.maxgen or eta<self.eta:
                 goal=True
-            gen+=1
+                self.generation=0
+            if self.checkpoint!=None and (goal or self.generation%self.checkpoint_every==0):
+                self.save(self.checkpoint)
+
+    def save(self,fname):
+        ## Write the complete state of this population to a checkpoint.
+        ## The history and the fitness cache only grow, so they are appended to a log (fname+'.log', one line of
+        ## JSON per checkpoint) that only receives the entries that are new since the last checkpoint.
+        ## Everything else (settings, parameter space, population, generation counter, state of the random
+        ## number generator) is small and written to the JSON file fname, together with the length of the log.
+        ## This file is first written to a temporary file and then renamed, so a crash never leaves
+        ## a broken checkpoint behind. Log entries written after the last complete checkpoint are ignored.
+        ## Note: Functions that draw their own random numbers have to take care of their own seeds
+        ## if a resumed evolution should be identical to an uninterrupted one.
+        cache = self.cache or {}
+        log = self.logged
+        if log==None or log['File']!=fname or log['CacheId']!=id(self.cache) or log['Cache']>len(cache) \
+           or log['Param']>len(self.history['Param']) or log['Result']>len(self.history['Result']):
+            log = {'File':fname,'Size':0,'Param':0,'Result':0,'Cache':0,'CacheId':id(self.cache)} ## New log
+        entry = {'Param':self.history['Param'][log['Param']:],
+                 'Result':self.history['Result'][log['Result']:],
+                 'Cache':[[list(k),v] for k,v in itertools.islice(cache.items(),log['Cache'],None)]}
+        logname = fname+'.log'
+        mode = 'wb'
+        if log['Size']>0 and os.path.exists(logname):
+            mode = 'r+b'
+        with open(logname,mode) as outf:
+            outf.seek(log['Size'])
+            outf.truncate() ## Drop entries of an interrupted checkpoint
+            outf.write((json.dumps(entry,separators=(',',':'))+'\n').encode())
+            outf.flush()
+            os.fsync(outf.fileno())
+            size = outf.tell()
+        log = {'File':fname,'Size':size,'Param':len(self.history['Param']),'Result':len(self.history['Result']),
+               'Cache':len(cache),'CacheId':id(self.cache)}
+
+        rs = self.rng.getstate()
+        state = {'Settings':{'psize':self.psize,'mutation':self.mutation,'selection':self.selection,
+                             'eta':self.eta,'maxgen':self.maxgen,'checkpoint_every':self.checkpoint_every,
+                             'surrogate':self.surrogate,'oversample':self.oversample,'window':self.window,
+                             'sampling':self.sampling,'racing':self.racing,'confidence':self.confidence},
+                 'Paramspace':self.paramspace,
+                 'Population':self.population,
+                 'Log':{'Size':log['Size'],'Param':log['Param'],'Result':log['Result'],'Cache':log['Cache']},
+                 'Generation':self.generation,
+                 'Evaluations':[self.evaluations,self.cachehits,self.rejected],
+                 'RNG':[rs[0],rs[1],rs[2]],
+                 'Cache':self.cache!=None,
+                 'CMA':None,
+                 'Replicas':[[list(k),v] for k,v in self.replicas.items()]}
+        if self.cma!=None:
+            state['CMA'] = {'Mean':self.cma['Mean'],'C':self.cma['C'],'Sigma':self.cma['Sigma'],'Path':self.cma['Path']}
+
+        tmpname = fname+'.tmp'
+        with open(tmpname,'w') as outf:
+            json.dump(state,outf,separators=(',',':'))
+            outf.flush()
+            os.fsync(outf.fileno())
+        os.replace(tmpname,fname)
+        self.logged = log
+
+    def load(self,fname):
+        ## Restore the state of this population from a checkpoint written by .save().
+        with open(fname) as inf:
+            state = json.load(inf)
+        size = state['Log']['Size']
+        with open(fname+'.log','rb') as inf:
+            lines = inf.read(size).decode().splitlines() ## Only the entries of this checkpoint
+        history = {'Param':[],'Result':[]}
+        cache = []
+        for line in lines:
+            entry = json.loads(line)
+            history['Param']+=entry['Param']
+            history['Result']+=entry['Result']
+            cache+=entry['Cache']
+
+        for k,v in state['Settings'].items():
+            setattr(self,k,v)
+        self.paramspace = [tuple(p) for p in state['Paramspace']]
+        self.population = state['Population']
+        self.history = {'Param':[[tuple(p) for p in ps] for ps in history['Param']],
+                        'Result':[[(r[0],r[1]) for r in rk] for rk in history['Result']]}
+        self.generation = state['Generation']
+        self.evaluations,self.cachehits,self.rejected = state['Evaluations']
+        rs = state['RNG']
+        self.rng.setstate((rs[0],tuple(rs[1]),rs[2]))
+        if not state['Cache']:
+            self.cache = None
+        else:
+            self.cache = {}
+            for k,v in cache:
+                self.cache[tuple(k)]=v
+        self.replicas = {}
+        for k,v in state['Replicas']:
+            self.replicas[tuple(k)]=v
+        self.cma = state['CMA']
+        if self.cma!=None:
+            self.cma['L'] = cholesky(self.cma['C'])
+        self.logged = {'File':fname,'Size':size,'Param':len(self.history['Param']),
+                       'Result':len(self.history['Result']),'Cache':len(self.cache or {}),'CacheId':id(self.cache)}
+
+    @classmethod
+    def resume(cls,fname):
+        ## Create a GeneticAlgorithm from a checkpoint file. Calling .evolve() on the returned object
+        ## continues an interrupted evolution exactly where the checkpoint was written.
+        ## Further checkpoints are written to the same file.
+        with open(fname) as inf:
+            nparam = len(json.load(inf)['Paramspace'])
+        ga = cls(nparam,psize=0)
+        ga.load(fname)
+        ga.checkpoint = fname
+        return ga
 
     def write_history(self,fname=None):
         ## Output of the evolutionary history.
@@ -181,6 +633,203 @@ class GeneticAlgorithm:
     def age(self):
         ## This method just returns the number of passed generations.
         return len(self.history['Result'])
+
+    def emigrants(self,n=1):
+        ## Returns copies of the n best individuals of the last generation.
+        ## Used to send individuals from one population to another (see IslandModel).
+        if len(self.history['Result'])==0:
+            return []
+        return [list(r[1]) for r in self.history['Result'][-1][:n]]
+
+    def immigrate(self,inds):
+        ## Adds individuals from another population to this one. The immigrants replace the
+        ## youngest offspring, so the survivors of the last selection are never displaced.
+        ## The immigrants are tested along with everyone else in the next call of .optimize().
+        nfree = self.psize-int(self.psize*(1-self.selection))
+        if self.age()==0:
+            nfree = self.psize
+        n = min(len(inds),nfree)
+        for i in range(n):
+            self.population[len(self.population)-n+i] = list(inds[i])
+
+
+def print_metrics(ga,metrics):
+    ## A simple callback for GeneticAlgorithm that prints one line per generation.
+    ## Usage: ga.callback = print_metrics
+    print('Gen {0:4}  Evals {1:5} ({2:8.1f}/s)  Hits {3:5}  Eval {4:8.3f}s  Select {5:7.4f}s  Update {6:7.4f}s  Best {7:.6g}  Mean {8:.6g}  Spread {9:.4g}'.format(
+        metrics['Generation'],metrics['Evaluations'],metrics['EvalsPerSec'],metrics['CacheHits'],
+        metrics['EvalTime'],metrics['SelectTime'],metrics['UpdateTime'],
+        metrics['Best'],metrics['Mean'],max(metrics['Spread'])))
+
+
+def solve(A,b):
+    ## Assisting function to solve the linear equation system A*x = b (Gaussian elimination with pivoting).
+    ## A is a list of rows. Returns x as a list or None if the system has no unique solution.
+    n = len(b)
+    m = [list(A[i])+[b[i]] for i in range(n)]
+    for c in range(n):
+        p = max(range(c,n),key=lambda r: abs(m[r][c]))
+        if abs(m[p][c])<1e-300:
+            return None
+        m[c],m[p] = m[p],m[c]
+        for r in range(c+1,n):
+            f = m[r][c]/m[c][c]
+            if not f==0:
+                for k in range(c,n+1):
+                    m[r][k]-=f*m[c][k]
+    x = [0.0]*n
+    for r in range(n-1,-1,-1):
+        x[r] = (m[r][n]-sum([m[r][k]*x[k] for k in range(r+1,n)]))/m[r][r]
+    return x
+
+
+def cholesky(A):
+    ## Assisting function to compute the lower triangular Cholesky factor L of a symmetric matrix A (A = L*L').
+    ## Returns None if A is not positive definite.
+    n = len(A)
+    L = [[0.0]*n for i in range(n)]
+    for i in range(n):
+        for j in range(i+1):
+            s = A[i][j]-sum([L[i][k]*L[j][k] for k in range(j)])
+            if i==j:
+                if s<=0:
+                    return None
+                L[i][i] = s**.5
+            else:
+                L[i][j] = s/L[j][j]
+    return L
+
+
+def island_worker(conn,ga,funct,args):
+    ## Runs one island of an IslandModel in its own process. The island waits for orders on conn:
+    ## ('run', ngen, immigrants, nemigrants) lets the population take in the immigrants and evolve
+    ## for ngen generations. It answers with its best individuals and the best and worst result of the
+    ## last generation. ('stop',) sends the complete GeneticAlgorithm back and ends the process.
+    try:
+        while True:
+            order = conn.recv()
+            if order[0]=='run':
+                ga.immigrate(order[2])
+                for g in range(order[1]):
+                    ranking = ga.optimize(funct,*args)
+                conn.send((ga.emigrants(order[3]),ranking[0][0],ranking[-1][0]))
+            else:
+                conn.send(ga)
+                break
+    except Exception as e:
+        conn.send(e) ## Pass the error on to the IslandModel which raises it.
+    conn.close()
+
+
+class IslandModel:
+    ## This class runs several independent populations (islands) of GeneticAlgorithm in separate processes.
+    ## Every few generations, the best individuals of each island migrate to the neighboring islands.
+    ## Since the islands only talk to each other at these migrations, the model scales with the number of cores.
+    def __init__(self, islands=4, nparam=1, priors=None, psize=50, mutation=0.2, selection=0.6,
+                 interval=5, migrants=2, topology='ring', seed=None):
+        ## islands: Number of populations. Each runs in its own process during .evolve().
+        ## nparam, priors, psize, mutation, selection: Passed on to each GeneticAlgorithm.
+        ## interval: Number of generations between two migrations.
+        ## migrants: Number of best individuals each island sends to each of its neighbors.
+        ## topology: Who sends migrants to whom. 'ring' sends to the next island in line, 'full' sends to
+        ##           all other islands. A dictionary {source:[target,target,...]} defines any other topology.
+        ## seed: Optional seed. Each island gets its own random stream derived from this seed.
+        ##       Without a seed, it is taken from the random module (see GeneticAlgorithm).
+
+        if seed==None:
+            seed = random.getrandbits(64)
+        self.rng = random.Random(seed)
+        self.interval = interval
+        self.migrants = migrants
+        self.topology = topology
+        self.eta=0.0001 ## Convergence criterium. The evolution stops if the results of all islands lie within an interval of breadth eta.
+        self.maxgen=50  ## Usual maximal number of generations.
+        self.islands = []
+        for i in range(islands):
+            self.islands.append(GeneticAlgorithm(nparam,priors,psize,mutation,selection,
+                                                 seed=self.rng.getrandbits(64)))
+
+    def routes(self):
+        ## Returns a list with the targets of migrants for each island.
+        n = len(self.islands)
+        targets = []
+        for i in range(n):
+            if self.topology=='ring':
+                targets.append([(i+1)%n])
+            elif self.topology=='full':
+                targets.append([j for j in range(n) if not j==i])
+            else:
+                targets.append(list(self.topology.get(i,[])))
+        return targets
+
+    def evolve(self,funct,*args):
+        ## Macro-Evolution of all islands. Each island evolves for .interval generations, then the migrants
+        ## are exchanged. The abort conditions are the same as in GeneticAlgorithm.evolve(), but they
+        ## are checked for all islands together at each migration: The maximum number of generations
+        ## (self.maxgen) is reached or the results of all islands vary by less than self.eta.
+        ##
+        ## The function and its arguments are sent to other processes. Therefore, they have to
+        ## be defined at the top level of a module.
+
+        routes = self.routes()
+        conns = []
+        procs = []
+        for ga in self.islands:
+            here,there = multiprocessing.Pipe()
+            p = multiprocessing.Process(target=island_worker,args=(there,ga,funct,args))
+            p.start()
+            conns.append(here)
+            procs.append(p)
+
+        try:
+            immigrants = [[] for i in self.islands]
+            gen = 0
+            goal = False
+            while not goal:
+                ngen = max(1,min(self.interval,self.maxgen+1-gen))
+                for i in range(len(conns)):
+                    conns[i].send(('run',ngen,immigrants[i],self.migrants))
+                replies = [self.receive(c) for c in conns]
+                gen+=ngen
+
+                eta = abs(max([r[1] for r in replies])-min([r[2] for r in replies]))
+                if gen>self.maxgen or eta<self.eta:
+                    goal=True
+
+                immigrants = [[] for i in self.islands]
+                for i in range(len(replies)):
+                    for j in routes[i]:
+                        immigrants[j]+=replies[i][0]
+
+            for c in conns:
+                c.send(('stop',))
+            self.islands = [self.receive(c) for c in conns]
+        finally:
+            for p in procs:
+                p.join(1)
+                if p.is_alive():
+                    p.terminate()
+
+    def receive(self,conn):
+        ## Assisting function to receive a message from an island and raise errors that happened there.
+        msg = conn.recv()
+        if isinstance(msg,Exception):
+            raise msg
+        return msg
+
+    def bestguess(self):
+        ## Returns the best current estimation of optimal parameters over all islands.
+        best = None
+        for ga in self.islands:
+            if ga.age()>0:
+                r = ga.history['Result'][-1][0]
+                if best==None or r[0]>best[0]:
+                    best = r
+        return best[1]
+
+    def age(self):
+        ## Returns the number of passed generations.
+        return max([ga.age() for ga in self.islands])
             
             
 ## The function below is a very simple problem to be solved by an evolutionary algorithm.
@@ -237,6 +886,13 @@ if __name__ == "__main__":
 
     ## Write the history to a file to inspect later.
     g.write_history('test.xls')
+
+    ## Set up four islands of genetic algorithms that run in separate processes and
+    ## exchange their two best individuals with the next island every five generations.
+    im = IslandModel(4,3,interval=5,migrants=2)
+    im.evolve(simulation,[3,2,1])
+    print(im.bestguess())
+    print(im.age())
     
     
         
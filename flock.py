@@ -0,0 +1,309 @@
+import math
+import array
+import random
+import multiprocessing
+from multiprocessing import shared_memory
+
+############################ About this script
+#
+# This script simulates large flocks of boids (see the class Boid in easyabm.py) with several processes.
+# The arena is split into vertical strips, and each process moves the boids that are currently in its strip.
+# The positions and directions of all boids live in shared memory, so no data is copied between the processes:
+# Each process reads the boids in its strip and in the halo (a margin of one scan radius around the strip,
+# including the other side of the arena if the arena is a torus) directly from the shared arrays.
+# A boid that crosses the border of a strip simply belongs to the neighboring process in the next tick.
+#
+# The update is synchronous (double buffered): In each tick, all processes read the state of the previous tick
+# from one buffer and write the new state to the other buffer. A barrier at the end of each tick makes sure
+# all processes are done before the buffers change roles. The result therefore does not depend on the order of
+# the boids or the number of processes (except for the random jerks, as each process has its own random stream).
+#
+# The rules of each boid are the same as in Boid.scan(), Boid.align(), and Boid.boidmove(). Boids that leave the
+# arena are teleported to the opposite side, as in .boidmove(). With wrap=True, the neighborhood also reaches
+# across the edges (the arena is a real torus), otherwise boids only see each other within the arena like in easyabm.
+#
+# Usage:
+#   f = Flock(10000,width=4000,height=4000,workers=4)
+#   f.run(1000)
+#   agents = f.agents()  ## Boid objects with the final state (without display)
+#
+# Classes:
+# - Flock: Holds the state of the flock, the parameters of the boids, and runs the worker processes.
+#
+# Functions:
+# - bearing: Absolute angle of an offset (as in Agent.relative()).
+# - flock_worker: The loop of one worker process.
+
+
+def bearing(xd,yd):
+    ## Absolute angle of the offset (xd,yd), computed like in Agent.relative().
+    if xd<0:
+        return math.atan(yd/xd)+math.pi
+    elif xd>0:
+        return math.atan(yd/xd)
+    elif yd>0:
+        return math.pi/2
+    return math.pi*1.5
+
+
+class Flock():
+    ## A flock of boids that is simulated by several processes on shared memory.
+    def __init__(self,n=100,width=1000,height=1000,size=4,speed=1,radius=90,dist=30,step=0.01,jerk=0.1,
+                 workers=2,wrap=False,agents=None,seed=None):
+        ## n: Number of boids (ignored if agents are passed).
+        ## width, height: Size of the arena. As for an Agent, the boids stay within size and width-size.
+        ## size, speed: Size and speed of all boids.
+        ## radius, dist, step, jerk: Parameters of .scan() and .align() of the class Boid.
+        ## workers: Number of processes (and strips of the arena).
+        ## wrap: If True, boids also see neighbors across the edges of the arena.
+        ## agents: Optional list of Agent objects to take the initial positions and directions from.
+        ## seed: Optional seed for the initial positions and the random streams of the workers.
+        self.limit = (size,size,width-size,height-size)
+        self.size = size
+        self.speed = speed
+        self.radius = radius
+        self.dist = dist
+        self.step = step
+        self.jerk = jerk
+        self.workers = workers
+        self.wrap = wrap
+        self.rng = random.Random(seed)
+        self.t = 0
+
+        if agents!=None:
+            self.x = [float(a.xpos) for a in agents]
+            self.y = [float(a.ypos) for a in agents]
+            self.d = [float(a.direction) for a in agents]
+        else: ## Random initial state, like in Agent.__init__()
+            self.x = [float(self.rng.randint(self.limit[0],self.limit[2])) for i in range(n)]
+            self.y = [float(self.rng.randint(self.limit[1],self.limit[3])) for i in range(n)]
+            self.d = [self.rng.random()*2*math.pi for i in range(n)]
+
+    def run(self,ticks=1000):
+        ## Simulate the given number of ticks with self.workers processes.
+        ## The shared memory holds two buffers with three arrays each (x, y, direction).
+        n = len(self.x)
+        shm = shared_memory.SharedMemory(create=True,size=max(1,6*n*8))
+        try:
+            buf = shm.buf.cast('d')
+            for b,l in enumerate([self.x,self.y,self.d]):
+                buf[b*n:(b+1)*n] = array.array('d',l)
+            buf.release()
+
+            settings = {'limit':self.limit,'speed':self.speed,'radius':self.radius,'dist':self.dist,
+                        'step':self.step,'jerk':self.jerk,'wrap':self.wrap,'workers':self.workers,'t':self.t}
+            barrier = multiprocessing.Barrier(self.workers)
+            procs = []
+            for k in range(self.workers):
+                p = multiprocessing.Process(target=flock_worker,
+                                            args=(shm.name,n,k,settings,ticks,barrier,self.rng.getrandbits(64)))
+                p.start()
+                procs.append(p)
+            for p in procs:
+                p.join()
+            if any([not p.exitcode==0 for p in procs]):
+                raise RuntimeError('A worker of the flock failed.')
+
+            self.t+=ticks
+            buf = shm.buf.cast('d')
+            b = (self.t%2)*3*n ## Buffer with the newest state
+            self.x = buf[b:b+n].tolist()
+            self.y = buf[b+n:b+2*n].tolist()
+            self.d = buf[b+2*n:b+3*n].tolist()
+            buf.release()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def agents(self,master=None):
+        ## Returns the flock as a list of Boid objects (see easyabm.py) with the current state.
+        ## Without master, the Boids are not displayed.
+        import easyabm
+        if master==None:
+            master = [self.limit[2]+self.size,self.limit[3]+self.size]
+        out = []
+        for i in range(len(self.x)):
+            b = easyabm.Boid(master,x=self.x[i],y=self.y[i],direction=self.d[i],size=self.size)
+            b.speed = self.speed
+            b.col = "#80ffaa"
+            out.append(b)
+        return out
+
+
+def flock_worker(name,n,k,settings,ticks,barrier,seed):
+    ## The loop of one worker process of a Flock. The worker owns strip k of the arena.
+    shm = shared_memory.SharedMemory(name=name) ## The main process creates and removes the memory.
+    buf = shm.buf.cast('d')
+    rng = random.Random(seed)
+
+    limit = settings['limit']
+    speed = settings['speed']
+    radius = settings['radius']
+    dist = settings['dist']
+    step = settings['step']
+    jerk = settings['jerk']
+    wrap = settings['wrap']
+    nstrips = settings['workers']
+    lx = limit[2]-limit[0]
+    ly = limit[3]-limit[1]
+    width = lx/nstrips
+    lo = limit[0]+k*width
+    center = lo+width/2
+    ncx = max(1,int(lx//radius)) ## Cells of at least one radius for the neighbor search
+    ncy = max(1,int(ly//radius))
+
+    def strip(x):
+        return min(nstrips-1,max(0,int((x-limit[0])/width)))
+    def cell(x,y):
+        return (min(ncx-1,max(0,int((x-limit[0])/lx*ncx))),min(ncy-1,max(0,int((y-limit[1])/ly*ncy))))
+
+    try:
+        for t in range(settings['t'],settings['t']+ticks):
+            src = (t%2)*3*n
+            dst = ((t+1)%2)*3*n
+            X = buf[src:src+n]
+            Y = buf[src+n:src+2*n]
+            D = buf[src+2*n:src+3*n]
+
+            ## Find own boids and the boids in the halo, and sort them into cells.
+            own = []
+            cells = {}
+            for i in range(n):
+                x = X[i]
+                if strip(x)==k:
+                    own.append(i)
+                else:
+                    dx = x-center
+                    if wrap:
+                        dx-=lx*round(dx/lx)
+                    if abs(dx)>=width/2+radius:
+                        continue
+                c = cell(x,Y[i])
+                if c in cells:
+                    cells[c].append(i)
+                else:
+                    cells[c] = [i]
+
+            for i in own:
+                sx,sy,sd = X[i],Y[i],D[i]
+                cx,cy = cell(sx,sy)
+                found = []
+                for ax in (cx-1,cx,cx+1):
+                    for ay in (cy-1,cy,cy+1):
+                        if wrap:
+                            c = (ax%ncx,ay%ncy)
+                        else:
+                            c = (ax,ay)
+                        found+=cells.get(c,[])
+                neighbors = []
+                for j in sorted(set(found)): ## Same order as in the list of agents
+                    xd = X[j]-sx
+                    yd = Y[j]-sy
+                    if wrap:
+                        xd-=lx*round(xd/lx)
+                        yd-=ly*round(yd/ly)
+                    d = (xd**2+yd**2)**.5
+                    if d < 1: d = 1
+                    if d < radius and d > 1:
+                        neighbors.append((j,xd,yd,d))
+
+                nd = sd
+                if len(neighbors)>0: ## Same rules as Boid.align()
+                    rdir = 0.0
+                    for j,xd,yd,d in neighbors:
+                        rd = D[j]-sd
+                        if rd > math.pi:
+                            rd-= 2*math.pi
+                        if rd < -math.pi:
+                            rd+=2*math.pi
+                        rdir+=rd
+                    rdir=rdir/len(neighbors)
+
+                    corr = 0
+                    xg = 0.0
+                    yg = 0.0
+                    for j,xd,yd,d in neighbors:
+                        if wrap: ## Gravity center of the neighbors as seen from this boid
+                            xg+=(sx+xd)/len(neighbors)
+                            yg+=(sy+yd)/len(neighbors)
+                        else:
+                            xg+=X[j]/len(neighbors)
+                            yg+=Y[j]/len(neighbors)
+                        if d<dist:
+                            ra = bearing(xd,yd)-sd
+                            if ra > math.pi:
+                                ra-=2*math.pi
+                            elif ra < -math.pi:
+                                ra+=2*math.pi
+                            if ra>0:
+                                corr-=dist/d
+                            else:
+                                corr+=dist/d
+
+                    ra = bearing(xg-sx,yg-sy)-sd
+                    if ra > math.pi:
+                        ra-=2*math.pi
+                    elif ra < -math.pi:
+                        ra+=2*math.pi
+                    if ra>=0:
+                        corr+=1
+                    else:
+                        corr-=1
+
+                    if abs(rdir)<step:
+                        nd+=rdir
+                    elif rdir>0:
+                        nd+=step
+                    else:
+                        nd-=step
+                    if corr > 0:
+                        nd+=step
+                    elif corr < 0:
+                        nd-=step
+                    if rng.random()>jerk:
+                        nd+=(rng.random()-0.5)*step
+
+                ## Move like Boid.boidmove(): Teleport to the other side of the arena at the edges.
+                nx = sx+speed*math.cos(nd)
+                ny = sy+speed*math.sin(nd)
+                if nx<limit[0]:
+                    nx=limit[2]
+                elif nx>limit[2]:
+                    nx=limit[0]
+                if ny<limit[1]:
+                    ny=limit[3]
+                elif ny>limit[3]:
+                    ny=limit[1]
+                if nd > 2*math.pi: ## Keep the direction between 0 and 2*pi (as Agent.shift() does)
+                    nd-=2*math.pi
+                elif nd < 0:
+                    nd+=2*math.pi
+                buf[dst+i] = nx
+                buf[dst+n+i] = ny
+                buf[dst+2*n+i] = nd
+
+            X.release()
+            Y.release()
+            D.release()
+            barrier.wait() ## Everyone is done with this tick. The buffers change roles.
+    except Exception:
+        barrier.abort() ## Don't let the other workers wait forever.
+        raise
+    finally:
+        buf.release()
+        shm.close()
+
+
+if __name__ == "__main__":
+
+    ## Example: A flock of 2000 boids on four processes.
+    import time
+    f = Flock(2000,width=3000,height=3000,workers=4,seed=1)
+    t = time.time()
+    f.run(100)
+    print('100 ticks in',round(time.time()-t,2),'seconds')
+
+    ## Alignment of the flock (1 = all boids fly in the same direction)
+    x = sum([math.cos(d) for d in f.d])
+    y = sum([math.sin(d) for d in f.d])
+    print((x**2+y**2)**.5/len(f.d))
@@ -0,0 +1,313 @@
+import os
+import zlib
+import queue
+import struct
+import multiprocessing
+
+import numpy as np
+
+############################ About this script
+#
+# This script records simulations without a display (e.g. on batch nodes without Tk or X server).
+# The agents are drawn into NumPy arrays (frames) as they would appear on a Display of easyabm.py:
+# A circle in the color of the agent with a black outline, a black dot at the front, and optionally a trail
+# of its last positions. The frames are written as a sequence of PNG files or as one animated GIF.
+# Encoding is slow compared to drawing, so it is done by a separate process while the simulation goes on.
+#
+# Usage:
+#   rec = Recorder('boids.gif',width=400,height=400,every=5,trails=20)
+#   s = easyabm.Scheduler()
+#   s.callback = rec  ## Called after each tick. Every 5th tick is recorded.
+#   easyabm.simulate_boids(30,master=[400,400],schedule=s)
+#   rec.close()
+#
+# Classes:
+# - GifWriter: Writes frames to an animated GIF file, one after another.
+# - Recorder: Draws frames of a simulation every k ticks and hands them to the encoding process.
+#
+# Functions:
+# - render: Draws a list of agents into a frame.
+# - write_png: Writes one frame as PNG file.
+# - lzw: The compression of GIF files.
+# - encode_worker: The loop of the encoding process.
+
+
+def rgb(col):
+    ## Translate a color of the form '#rrggbb' (as used by the agents) to a tuple (r,g,b).
+    if type(col)==str:
+        col = col.lstrip('#')
+        return (int(col[0:2],16),int(col[2:4],16),int(col[4:6],16))
+    return tuple(col)
+
+
+def stamp(r,ring=False):
+    ## Offsets (dy,dx) of all pixels of a disk with radius r (or only of its outline with ring=True).
+    r = max(r,0.5)
+    n = int(np.ceil(r))
+    dy,dx = np.mgrid[-n:n+1,-n:n+1]
+    d = (dx**2+dy**2)**.5
+    if ring:
+        keep = (d<=r)&(d>r-1)
+    else:
+        keep = d<=r
+    return dy[keep],dx[keep]
+
+
+def paint(frame,x,y,colors,offsets):
+    ## Paint the pixels at the offsets around each point (x,y) in the color of the point.
+    ## Pixels outside the frame are skipped.
+    dy,dx = offsets
+    rows = (np.round(y)[:,None]+dy[None,:]).astype(int)
+    cols = (np.round(x)[:,None]+dx[None,:]).astype(int)
+    inside = (rows>=0)&(rows<frame.shape[0])&(cols>=0)&(cols<frame.shape[1])
+    c = np.broadcast_to(colors[:,None,:],rows.shape+(3,))
+    frame[rows[inside],cols[inside]] = c[inside]
+
+
+def render(agents,width=1000,height=1000,scale=1.0,trails=0,background='#ffffff'):
+    ## Draw the agents into a new frame and return it as array of shape (height*scale, width*scale, 3).
+    ## width, height: Size of the arena (as on a Display).
+    ## scale: Size of the frame relative to the arena (e.g. 0.25 for a large arena).
+    ## trails: Number of past positions of each agent (from .history) that are drawn as a trail.
+    frame = np.empty((int(round(height*scale)),int(round(width*scale)),3),dtype=np.uint8)
+    frame[:,:] = rgb(background)
+    if len(agents)==0:
+        return frame
+    back = np.array(rgb(background),dtype=float)
+    colors = np.array([rgb(a.col) for a in agents],dtype=np.uint8)
+
+    if trails>0: ## Each trail is drawn in a paler color of its agent.
+        tx = []
+        ty = []
+        tc = []
+        for a,c in zip(agents,colors):
+            for h in a.history[-trails:]:
+                tx.append(h[0])
+                ty.append(h[1])
+                tc.append(c)
+        if len(tx)>0:
+            tc = ((np.array(tc,dtype=float)+back)/2).astype(np.uint8)
+            paint(frame,np.array(tx)*scale,np.array(ty)*scale,tc,stamp(0.5))
+
+    ## Agents of the same size are drawn at once.
+    x = np.array([a.xpos for a in agents],dtype=float)
+    y = np.array([a.ypos for a in agents],dtype=float)
+    d = np.array([a.direction for a in agents],dtype=float)
+    sizes = np.array([a.size for a in agents],dtype=float)
+    black = np.zeros((len(agents),3),dtype=np.uint8)
+    for s in np.unique(sizes):
+        k = sizes==s
+        paint(frame,x[k]*scale,y[k]*scale,colors[k],stamp(s*scale))
+        paint(frame,x[k]*scale,y[k]*scale,black[k],stamp(s*scale,ring=True))
+        hx = np.round(x[k]+s*np.cos(d[k])) ## Front of the agent, like in Agent.position()
+        hy = np.round(y[k]+s*np.sin(d[k]))
+        paint(frame,hx*scale,hy*scale,black[k],stamp(max(s*scale/4,0.5)))
+    return frame
+
+
+def chunk(ctype,data):
+    ## A chunk of a PNG file.
+    return struct.pack('>I',len(data))+ctype+data+struct.pack('>I',zlib.crc32(ctype+data)&0xffffffff)
+
+def write_png(fname,frame,level=6):
+    ## Write a frame (array of shape (height, width, 3) with type uint8) as PNG file.
+    h,w = frame.shape[0],frame.shape[1]
+    raw = np.zeros((h,w*3+1),dtype=np.uint8) ## Each row starts with the filter type 0 (none)
+    raw[:,1:] = frame.reshape(h,w*3)
+    with open(fname,'wb') as outf:
+        outf.write(b'\x89PNG\r\n\x1a\n')
+        outf.write(chunk(b'IHDR',struct.pack('>IIBBBBB',w,h,8,2,0,0,0)))
+        outf.write(chunk(b'IDAT',zlib.compress(raw.tobytes(),level)))
+        outf.write(chunk(b'IEND',b''))
+
+
+def palette(frame):
+    ## Reduce a frame to at most 256 colors. Returns the palette (array of shape (n,3)) and the index of
+    ## each pixel. Frames of simulations usually have few colors. If there are more, they are rounded
+    ## to a cube of 6x6x6 colors.
+    packed = (frame[:,:,0].astype(np.uint32)<<16)|(frame[:,:,1].astype(np.uint32)<<8)|frame[:,:,2]
+    colors,index = np.unique(packed,return_inverse=True)
+    if len(colors)>256:
+        q = (frame.astype(np.uint32)+25)//51*51
+        packed = (q[:,:,0]<<16)|(q[:,:,1]<<8)|q[:,:,2]
+        colors,index = np.unique(packed,return_inverse=True)
+    pal = np.stack([(colors>>16)&255,(colors>>8)&255,colors&255],axis=1).astype(np.uint8)
+    return pal,index.reshape(frame.shape[:2]).astype(np.uint8)
+
+
+def lzw(data,bits):
+    ## LZW compression of a string of color indices (bytes) as used in GIF files.
+    ## bits: Number of bits of the color indices (2 to 8).
+    clear = 1<<bits
+    end = clear+1
+    out = bytearray()
+    buf = 0    ## Bits that are not written yet
+    nbuf = 0
+
+    codes = {}
+    nextcode = end+1
+    buf|=clear<<nbuf ## Start with a clear code
+    nbuf+=bits+1
+    prefix = data[0]
+    for k in data[1:]:
+        key = (prefix<<8)|k
+        c = codes.get(key)
+        if c!=None:
+            prefix = c
+            continue
+        ## The decoder adds its codes one step later, so the width is set by the last code before this one.
+        size = min(12,(nextcode-1).bit_length())
+        buf|=prefix<<nbuf
+        nbuf+=size
+        if nextcode<4096:
+            codes[key] = nextcode
+            nextcode+=1
+        else: ## The table is full, start over
+            buf|=clear<<nbuf
+            nbuf+=12
+            codes = {}
+            nextcode = end+1
+        while nbuf>=8:
+            out.append(buf&255)
+            buf>>=8
+            nbuf-=8
+        prefix = k
+
+    size = min(12,(nextcode-1).bit_length())
+    buf|=prefix<<nbuf
+    nbuf+=size
+    buf|=end<<nbuf
+    nbuf+=min(12,nextcode.bit_length())
+    while nbuf>0:
+        out.append(buf&255)
+        buf>>=8
+        nbuf-=8
+    return bytes(out)
+
+
+class GifWriter():
+    ## Writes frames to an animated GIF file as they come. Each frame has its own palette.
+    def __init__(self,fname,delay=0.05,loop=0):
+        ## delay: Seconds between two frames. loop: Number of repetitions (0 = forever).
+        self.outf = open(fname,'wb')
+        self.delay = int(round(delay*100))
+        self.loop = loop
+        self.size = None
+
+    def add(self,frame):
+        h,w = frame.shape[0],frame.shape[1]
+        if self.size==None: ## Header with the size of the first frame
+            self.size = (w,h)
+            self.outf.write(b'GIF89a'+struct.pack('<HHBBB',w,h,0,0,0))
+            self.outf.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01'+struct.pack('<H',self.loop)+b'\x00')
+        elif not self.size==(w,h):
+            raise ValueError('All frames of a GIF must have the same size.')
+
+        pal,index = palette(frame)
+        bits = max(2,int(len(pal)-1).bit_length())
+        table = np.zeros((1<<bits,3),dtype=np.uint8)
+        table[:len(pal)] = pal
+        self.outf.write(b'\x21\xf9\x04\x04'+struct.pack('<H',self.delay)+b'\x00\x00') ## Delay of this frame
+        self.outf.write(b'\x2c'+struct.pack('<HHHHB',0,0,w,h,0x80|(bits-1))+table.tobytes())
+        self.outf.write(bytes([bits]))
+        data = lzw(index.tobytes(),bits)
+        for i in range(0,len(data),255): ## The data is written in blocks of at most 255 bytes
+            block = data[i:i+255]
+            self.outf.write(bytes([len(block)])+block)
+        self.outf.write(b'\x00')
+
+    def close(self):
+        self.outf.write(b'\x3b')
+        self.outf.close()
+
+
+def frame_name(fname,i):
+    ## Name of the PNG file of frame number i: 'run.png' gives 'run_00000.png', 'run_00001.png', ...
+    base,ext = os.path.splitext(fname)
+    return '{0}_{1:05d}{2}'.format(base,i,ext)
+
+def encode_worker(frames,fname,delay):
+    ## The loop of the encoding process: Take frames from the queue and write them until None arrives.
+    gif = None
+    if fname.lower().endswith('.gif'):
+        gif = GifWriter(fname,delay)
+    i = 0
+    while True:
+        frame = frames.get()
+        if frame is None: ## (A frame cannot be compared to None with ==)
+            break
+        if gif!=None:
+            gif.add(frame)
+        else:
+            write_png(frame_name(fname,i),frame)
+        i+=1
+    if gif!=None:
+        gif.close()
+
+
+class Recorder():
+    ## Records a simulation every k ticks. The frames are drawn in this process and encoded in another one.
+    ## A Recorder may be used as callback of a Scheduler (see easyabm.py) or called directly after each tick.
+    def __init__(self,fname,width=1000,height=1000,every=1,scale=1.0,trails=0,delay=0.05,
+                 background='#ffffff',buffer=16):
+        ## fname: Name of a GIF file ('run.gif') or of the PNG files ('run.png' gives 'run_00000.png', ...).
+        ## width, height: Size of the arena.
+        ## every: Draw a frame every k ticks.
+        ## scale, trails, background: See render().
+        ## delay: Seconds between two frames of a GIF.
+        ## buffer: Number of frames that may wait for the encoder. If the encoder falls behind by more,
+        ##         the simulation waits for it.
+        if not os.path.splitext(fname)[1].lower() in ['.gif','.png']:
+            raise ValueError('Unknown file type (use .gif or .png): '+fname)
+        self.fname = fname
+        self.width = width
+        self.height = height
+        self.every = every
+        self.scale = scale
+        self.trails = trails
+        self.background = background
+        self.t = 0        ## Number of calls so far
+        self.nframes = 0  ## Number of recorded frames
+        self.frames = multiprocessing.Queue(buffer)
+        self.proc = multiprocessing.Process(target=encode_worker,args=(self.frames,fname,delay))
+        self.proc.daemon = True
+        self.proc.start()
+
+    def __call__(self,source=None,agents=[]):
+        ## Count one tick and record the agents if it is time. Same arguments as a callback of a Scheduler.
+        ## Models that draw themselves with a method .frame(scale=...) (e.g. opinion.OpinionGrid) are recorded by it.
+        self.t+=1
+        if self.t%self.every==0:
+            if hasattr(source,'frame'):
+                self.put(source.frame(scale=self.scale))
+            else:
+                self.add(agents)
+
+    def add(self,agents):
+        ## Draw the agents and hand the frame to the encoder.
+        self.put(render(agents,self.width,self.height,self.scale,self.trails,self.background))
+
+    def put(self,frame):
+        ## Hand a ready frame (array of shape (height, width, 3) with type uint8) to the encoder.
+        while True:
+            try:
+                self.frames.put(frame,timeout=1.0)
+                break
+            except queue.Full:
+                if not self.proc.is_alive():
+                    raise RuntimeError('The encoder of the frames failed.')
+        self.nframes+=1
+
+    def close(self):
+        ## Wait until all frames are written.
+        if self.proc.is_alive():
+            self.frames.put(None)
+        self.proc.join()
+        if not self.proc.exitcode==0:
+            raise RuntimeError('The encoder of the frames failed.')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
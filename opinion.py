@@ -0,0 +1,165 @@
+import numpy as np
+
+############################ About this script
+#
+# This script simulates the opinion dynamics of Conformity.R on large grids.
+# Each cell of the grid is an agent with an attitude (between 1 and 5) and a propensity to talk (1 = talking,
+# 0 = silent). Attitude and talking are kept as 2-D arrays and all agents are updated at once: The influence of
+# the neighbors is summed up with shifted slices of the arrays instead of searching the neighbors of each agent.
+# Several replicates (grids with different initial attitudes) are simulated together in arrays of shape
+# (replicates, height, width).
+#
+# The rules are the same as in Conformity.R:
+# - The neighbors of an agent are all agents with a squared distance below 5 (12 neighbors).
+# - The climate around an agent is the mean attitude of its talking neighbors. The dissonance is the
+#   difference between the climate and the own attitude (0 if no neighbor talks).
+# - With a dissonance above 0.5, the agent is silent. Otherwise it talks and becomes more confident:
+#   Attitudes between 3 and 5 grow by 0.1, other attitudes above 1 shrink by 0.1.
+# - With a dissonance above 1, the agent takes the mean of its own attitude and the climate.
+# Other than in Conformity.R, where the agents are updated one after another, all agents are updated
+# at once (synchronously), based on the state of the previous step.
+#
+# The grid may be bounded (agents at the edge have fewer neighbors, as in Conformity.R) or wrapped (torus).
+# Like the agent simulations, the model takes a callback after each step, e.g. a frames.Recorder, which
+# draws the grid with the colors of Conformity.R.
+#
+# Usage:
+#   g = OpinionGrid(4096,4096,replicates=2,wrap=True,seed=1)
+#   g.callback = frames.Recorder('opinion.gif',4096,4096,scale=0.125)
+#   history = g.run(30)
+#
+# Classes:
+# - OpinionGrid: The grid(s) of agents and the simulation.
+#
+# Functions:
+# - colors: The colors of attitudes (Einst.Farbe in Conformity.R).
+
+
+def colors(att):
+    ## RGB colors (array of type uint8 with a last axis of 3) of attitudes: Red for 1, grey for 3, green for 5.
+    x = np.clip((np.asarray(att,dtype=float)-3)/2,-1,1)
+    main = np.abs(x)*.4+.6 ## Red or green
+    off = (1-np.abs(x))*.6 ## Other colors
+    rgb = np.stack([np.where(x<0,main,off),np.where(x>=0,main,off),off],axis=-1)
+    return (rgb*255+.5).astype(np.uint8)
+
+
+class OpinionGrid():
+    ## Grids of agents with attitudes and propensities to talk.
+    def __init__(self,height=15,width=15,replicates=1,wrap=False,reach=5,mean=3.0,sd=1.0,seed=None):
+        ## height, width: Size of the grid.
+        ## replicates: Number of grids that are simulated together.
+        ## wrap: If True, the grid is a torus. Otherwise, agents at the edges have fewer neighbors.
+        ## reach: Neighbors are all agents with a squared distance below reach.
+        ## mean, sd: Normal distribution of the initial attitudes.
+        ## seed: Optional seed of the random numbers.
+        self.rng = np.random.default_rng(seed)
+        self.wrap = wrap
+        self.att = self.rng.normal(mean,sd,(replicates,height,width))  ## Attitude (Einstellung)
+        self.talk = np.ones((replicates,height,width),dtype=bool)         ## Talking (Reden)
+        self.offsets = []
+        r = int(reach**.5)
+        for dy in range(-r,r+1):
+            for dx in range(-r,r+1):
+                if 0<dy**2+dx**2<reach:
+                    self.offsets.append((dy,dx))
+        self.margin = r
+        self.step_no = 0
+        self.callback = None ## Optional function callback(grid), called after each step
+        self.history = {'Step':[],'Mean_Att':[],'Mean_Att_Expressed':[],'Share_Express':[]}
+        self.record()
+
+    def neighbors(self,values):
+        ## Sum of the values of the neighbors of each agent. Beyond the edges of a bounded grid, the values are 0.
+        m = self.margin
+        if self.wrap:
+            pad = np.pad(values,((0,0),(m,m),(m,m)),mode='wrap')
+        else:
+            pad = np.pad(values,((0,0),(m,m),(m,m)))
+        h,w = values.shape[1],values.shape[2]
+        total = np.zeros(values.shape,dtype=float)
+        for dy,dx in self.offsets:
+            total+=pad[:,m+dy:m+dy+h,m+dx:m+dx+w]
+        return total
+
+    def step(self):
+        ## Update all agents at once.
+        self.step_no+=1
+        count = self.neighbors(self.talk)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            climate = self.neighbors(self.att*self.talk)/count
+        dissonance = np.abs(climate-self.att)
+        dissonance[count==0] = 0 ## No talking neighbors
+
+        self.talk = dissonance<=0.5
+        up = self.talk&(self.att>3)&(self.att<5)
+        down = self.talk&~up&(self.att>1)
+        att = self.att+.1*up-.1*down
+        ## With a dissonance above 1, take over the climate halfway
+        self.att = np.where(dissonance>1,(self.att+climate)/2,att)
+        self.record()
+        if self.callback!=None:
+            self.callback(self)
+
+    def record(self):
+        ## Add the mean attitude, the mean expressed attitude, and the share of talking agents of each replicate
+        ## to the history (as in the recording of Conformity.R).
+        n = self.talk.shape[1]*self.talk.shape[2]
+        talking = self.talk.sum(axis=(1,2))
+        with np.errstate(invalid='ignore',divide='ignore'):
+            expressed = (self.att*self.talk).sum(axis=(1,2))/talking
+        self.history['Step'].append(self.step_no)
+        self.history['Mean_Att'].append(self.att.mean(axis=(1,2)))
+        self.history['Mean_Att_Expressed'].append(expressed)
+        self.history['Share_Express'].append(talking/float(n))
+
+    def run(self,steps=30):
+        ## Simulate the given number of steps. Returns the history as dictionary of arrays (steps x replicates,
+        ## except for 'Step').
+        for i in range(steps):
+            self.step()
+        return dict([(k,np.array(v)) for k,v in self.history.items()])
+
+    def frame(self,replicate=0,cell=1,scale=1.0):
+        ## Picture of one replicate (array of shape (height*cell*scale, width*cell*scale, 3)), e.g. for a
+        ## frames.Recorder, which passes its scale. Each agent is a square of cell*scale pixels in the color of
+        ## its attitude. Silent agents get a black dot in the middle if the squares are large enough.
+        ## With less than one pixel per agent, only every k-th row and column of agents is drawn, so large
+        ## grids are scaled down before the picture is made.
+        att = self.att[replicate]
+        talk = self.talk[replicate]
+        cell = cell*scale
+        if cell<1:
+            k = int(round(1/cell))
+            att = att[::k,::k]
+            talk = talk[::k,::k]
+        cell = max(1,int(round(cell)))
+        img = colors(att)
+        if cell>1:
+            img = np.repeat(np.repeat(img,cell,axis=0),cell,axis=1)
+            if cell>=3:
+                c = cell//2
+                d = max(1,cell//6)
+                silent = np.repeat(np.repeat(~talk,cell,axis=0),cell,axis=1)
+                middle = np.abs(np.arange(cell)-c)<=d ## Pixels in the middle of a cell
+                rows = np.tile(middle,att.shape[0])
+                cols = np.tile(middle,att.shape[1])
+                img[silent&rows[:,None]&cols[None,:]] = 0
+        return img
+
+
+if __name__ == "__main__":
+
+    import time
+
+    ## Example 1: The 15x15 grid of Conformity.R, 100 replicates.
+    g = OpinionGrid(15,15,replicates=100,seed=2021)
+    h = g.run(30)
+    print('15x15: Mean attitude',h['Mean_Att'][-1].mean(),'expressed',np.nanmean(h['Mean_Att_Expressed'][-1]),
+          'share talking',h['Share_Express'][-1].mean())
+
+    ## Example 2: A wrapped grid of 4096x4096 agents.
+    t = time.time()
+    g = OpinionGrid(4096,4096,wrap=True,seed=1)
+    h = g.run(10)
+    print('4096x4096:',round(time.time()-t,1),'seconds for 10 steps, share talking',h['Share_Express'][-1])